@@ -0,0 +1,147 @@
+"""
+Analysis of hourly statistics files, rows of 24 comma-separated average workloads of a day.
+
+Files are parsed in chunks of bytes straight into NumPy arrays, so even multi-gigabyte files
+never have their whole text in memory, and parsed arrays are cached until the file changes.
+"""
+
+from collections.abc import Iterator, Sequence
+import argparse
+import json
+import os
+
+import numpy as np
+
+
+HOURS = 24
+CHUNK_BYTES = 1 << 26
+
+# path -> (modification time in ns, size, parsed rows)
+_cache: dict[str, tuple[int, int, np.ndarray]] = {}
+
+
+def _parse_lines(lines: list[bytes]) -> np.ndarray:
+    # rows of another length are skipped, as they were by the csv reader
+    rows = [line for line in lines if line.count(b',') == HOURS - 1]
+    if not rows:
+        return np.empty((0, HOURS))
+
+    return np.fromstring(b','.join(rows).decode('ascii'), sep=',').reshape(-1, HOURS)
+
+
+def iter_hourly_chunks(filepath: str, chunk_bytes: int = CHUNK_BYTES) -> Iterator[np.ndarray]:
+    """
+    Rows of the file in arrays of shape (rows, 24), one array for every chunk of bytes.
+    """
+    with open(filepath, 'rb') as file:
+        rest = b''
+        while chunk := file.read(chunk_bytes):
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+
+            rows = _parse_lines(lines)
+            if len(rows):
+                yield rows
+
+        rows = _parse_lines([rest])
+        if len(rows):
+            yield rows
+
+
+def load_hourly_factors(filepath: str) -> np.ndarray:
+    """
+    All rows of the file as an array of shape (days, 24), the array is shared between calls
+    until the file is modified, so it must not be changed.
+    """
+    stat = os.stat(filepath)
+    cached = _cache.get(filepath)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    rows = np.concatenate([np.empty((0, HOURS)), *iter_hourly_chunks(filepath)])
+    rows.flags.writeable = False
+
+    _cache[filepath] = (stat.st_mtime_ns, stat.st_size, rows)
+    return rows
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+def hourly_means(filepath: str) -> np.ndarray:
+    rows = load_hourly_factors(filepath)
+    return rows.mean(axis=0) if len(rows) else np.zeros(HOURS)
+
+
+def hourly_percentiles(filepath: str, percentiles: Sequence[float] = (10, 50, 90)) -> np.ndarray:
+    """
+    Array of shape (len(percentiles), 24).
+    """
+    rows = load_hourly_factors(filepath)
+    if not len(rows):
+        return np.zeros((len(percentiles), HOURS))
+
+    return np.percentile(rows, percentiles, axis=0)
+
+
+def hourly_summary(filepath: str, percentiles: Sequence[float] = (10, 50, 90)) -> dict:
+    rows = load_hourly_factors(filepath)
+    values = hourly_percentiles(filepath, percentiles)
+
+    return {
+        'days': len(rows),
+        'mean': hourly_means(filepath).round(3).tolist(),
+        'percentiles': {str(p): row.round(3).tolist() for p, row in zip(percentiles, values)}
+    }
+
+
+def hourly_deltas(default_path: str, optimized_path: str) -> dict[str, list[float]]:
+    """
+    Differences of hourly means of optimized runs from default ones,
+    and the reduction of the workload in percent of the default one.
+    """
+    default = hourly_means(default_path)
+    optimized = hourly_means(optimized_path)
+
+    reduction = np.zeros(HOURS)
+    np.divide((default - optimized) * 100, default, out=reduction, where=default != 0)
+
+    return {
+        'absolute': (optimized - default).round(3).tolist(),
+        'reduction_percent': reduction.round(1).tolist()
+    }
+
+
+def peak_hours_diff(hours: Sequence[int], filepaths: Sequence[str]) -> list[float]:
+    """
+    For every hour, how much lower the lowest hourly mean of the files is than the highest one, in percent.
+    """
+    means = np.array([hourly_means(filepath) for filepath in filepaths])[:, list(hours)]
+    return ((1 - means.min(axis=0) / means.max(axis=0)) * 100).round(1).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize hourly statistics files')
+
+    parser.add_argument('filepaths', nargs='+', help='Paths to hourly statistics files')
+    parser.add_argument(
+        '--percentiles', default='10,50,90', help='Comma-separated percentiles of hourly workloads')
+    parser.add_argument(
+        '--deltas', action='store_true', help='Compare the second file (optimized) with the first one (default)')
+
+    args = parser.parse_args()
+
+    percentiles = [float(p) for p in args.percentiles.split(',')]
+    result = {filepath: hourly_summary(filepath, percentiles) for filepath in args.filepaths}
+
+    if args.deltas:
+        if len(args.filepaths) != 2:
+            parser.error("--deltas needs exactly two files")
+        result['deltas'] = hourly_deltas(*args.filepaths)
+
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+from time import perf_counter
+from statistics import median
+from tempfile import TemporaryDirectory
+from typing import Callable
+import argparse
+import os
+import platform
+import subprocess
+import json
+
+import numpy as np
+
+from graph import Graph, Junction, Locality, _are_compatible
+from mapgen import KINDS, generate_map, save_map
+from optimizer import optimize_graph
+from pathfinder import find_path
+from simulation import Simulation, load_graph
+
+
+SUITE_SIZES = (10, 1000, 100000)
+
+
+def _measure_ticks(simulation: Simulation, ticks: int) -> dict:
+    phases = {'generate': [], 'driving': [], 'tick': []}
+
+    def record_phases(simulation: Simulation) -> None:
+        for phase, durations in phases.items():
+            durations.append(simulation.phase_times[phase])
+
+    simulation.timing_phases = True
+    simulation.tick_hooks.append(record_phases)
+
+    for _ in range(ticks):
+        simulation.step()
+
+    result = {'seconds': round(sum(phases['tick']), 3)}
+    for phase, durations in phases.items():
+        result[f'{phase}_mean_us'] = round(sum(durations) / ticks * 1e6, 2)
+        result[f'{phase}_median_us'] = round(median(durations) * 1e6, 2)
+
+    return result
+
+
+def bench_ticks(
+    map_path: str = './map.json',
+    ticks: int = 28800,
+    seed: int = 0,
+    event_driven: bool = True,
+    optimized: bool = False
+) -> dict[str, float | int]:
+    """
+    Simulates the given number of ticks and measures the wall-clock time of a tick
+    and of its generation and driving phases, in microseconds per tick.
+    """
+    rng = np.random.default_rng(seed)
+    simulation = Simulation(load_graph(map_path, rng), optimized=optimized, event_driven=event_driven, rng=rng)
+
+    result = {'map': map_path, 'ticks': ticks, 'event_driven': event_driven, 'optimized': optimized}
+    result.update(_measure_ticks(simulation, ticks))
+    return result
+
+
+def bench_find_path(graph: Graph, searches: int = 20, seed: int = 0) -> dict[str, float | int]:
+    """
+    One-off searches between random pairs of localities.
+    """
+    rng = np.random.default_rng(seed)
+    localities = [node.idx for node in graph if isinstance(node, Locality)]
+
+    durations = []
+    for _ in range(searches):
+        start_idx, goal_idx = rng.choice(localities, size=2, replace=False).tolist()
+
+        started = perf_counter()
+        find_path(graph, start_idx, goal_idx)
+        durations.append(perf_counter() - started)
+
+    return {
+        'searches': searches,
+        'mean_us': round(sum(durations) / searches * 1e6, 2),
+        'median_us': round(median(durations) * 1e6, 2)
+    }
+
+
+def bench_compatibility(graph: Graph, checks: int = 10000, seed: int = 0) -> dict[str, float | int]:
+    """
+    StopLight.is_compatible for random pairs of stoplights of the graph,
+    first with an empty cache of compatibility checks and then with the filled one.
+    """
+    rng = np.random.default_rng(seed)
+    stoplights = [
+        stoplight for node in graph if isinstance(node, Junction) for stoplight in node.stoplights.values()
+    ]
+    pairs = [(stoplights[a], stoplights[b]) for a, b in rng.integers(len(stoplights), size=(checks, 2)).tolist()]
+
+    result: dict[str, float | int] = {'checks': checks}
+    _are_compatible.cache_clear()
+    for cache in ('cold', 'warm'):
+        started = perf_counter()
+        for stoplight, other in pairs:
+            stoplight.is_compatible(other)
+        result[f'{cache}_mean_us'] = round((perf_counter() - started) / checks * 1e6, 3)
+
+    return result
+
+
+def bench_optimize(graph: Graph, runs: int = 5) -> dict[str, float | int]:
+    """
+    optimize_graph over the current numbers of cars, stoplights get new times on every run.
+    """
+    durations = []
+    for _ in range(runs):
+        started = perf_counter()
+        optimize_graph(graph)
+        durations.append(perf_counter() - started)
+
+    return {
+        'runs': runs,
+        'mean_ms': round(sum(durations) / runs * 1e3, 3),
+        'median_ms': round(median(durations) * 1e3, 3)
+    }
+
+
+def bench_map(
+    map_path: str,
+    ticks: int = 28800,
+    seed: int = 0,
+    searches: int = 20,
+    checks: int = 10000,
+    runs: int = 5
+) -> dict:
+    """
+    All benchmarks on one map. The simulation runs the given number of ticks,
+    optimize_graph then runs over the numbers of cars of the middle tick.
+    """
+    rng = np.random.default_rng(seed)
+
+    started = perf_counter()
+    graph = load_graph(map_path, rng)
+    load_seconds = perf_counter() - started
+
+    started = perf_counter()
+    simulation = Simulation(graph, rng=rng)
+    setup_seconds = perf_counter() - started
+
+    result = {
+        'nodes': len(graph.nodes),
+        'roads': len(graph.edges),
+        'load_seconds': round(load_seconds, 3),
+        'setup_seconds': round(setup_seconds, 3),
+        'find_path': bench_find_path(graph, searches, seed),
+        'is_compatible': bench_compatibility(graph, checks, seed)
+    }
+
+    store = graph.edge_store
+    snapshot = store.cars.copy()
+
+    def keep_cars(simulation: Simulation) -> None:
+        if simulation.tick == ticks // 2:
+            snapshot[:] = store.cars
+
+    simulation.tick_hooks.append(keep_cars)
+    result['simulation'] = {'ticks': ticks, **_measure_ticks(simulation, ticks)}
+
+    # the simulation is not used after the day, so it may lose its cars
+    store.cars[:] = snapshot
+    result['optimize_graph'] = bench_optimize(graph, runs)
+
+    return result
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(
+    kinds: tuple[str, ...] = KINDS,
+    sizes: tuple[int, ...] = SUITE_SIZES,
+    ticks: int = 28800,
+    seed: int = 0,
+    on_result: Callable[[dict], None] | None = None
+) -> dict:
+    """
+    Benchmarks maps of every kind and size generated by mapgen with the given seed,
+    so results of different versions of the code can be compared.
+    """
+    results = []
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            for kind in kinds:
+                map_path = os.path.join(directory, f'{kind}_{size}.json')
+                save_map(generate_map(kind, size, seed), map_path)
+
+                result = {'kind': kind, 'size': size, **bench_map(map_path, ticks, seed)}
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'seed': seed,
+        'ticks': ticks,
+        'results': results
+    }
+
+
+def compare_suites(old: dict, new: dict) -> list[str]:
+    """
+    Ratios new / old of the timings of benchmarks present in both results.
+    """
+    def timings(suite: dict) -> dict[str, float]:
+        values = {}
+        for result in suite['results']:
+            for benchmark, stats in result.items():
+                if not isinstance(stats, dict):
+                    continue
+                for name, value in stats.items():
+                    if name.endswith(('_us', '_ms', 'seconds')):
+                        values[f"{result['kind']}/{result['size']}/{benchmark}/{name}"] = value
+        return values
+
+    old_timings = timings(old)
+    lines = []
+    for key, value in timings(new).items():
+        if old_timings.get(key):
+            lines.append(f"{key}: {old_timings[key]} -> {value} ({value / old_timings[key]:.2f}x)")
+
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the time of simulation ticks')
+
+    parser.add_argument('--map', default='./map.json', help='Path to the map file')
+    parser.add_argument('--ticks', type=int, default=28800, help='Number of simulated ticks')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of random generators')
+    parser.add_argument('--tick-mode', action='store_true', help='Visit every car on every tick')
+    parser.add_argument('--optimized', action='store_true', help='Turn on optimized mode')
+    parser.add_argument(
+        '--suite', action='store_true',
+        help='Benchmark path search, compatibility checks, the optimizer and the simulation on synthetic maps')
+    parser.add_argument('--kinds', default=','.join(KINDS), help='Comma-separated kinds of synthetic maps')
+    parser.add_argument(
+        '--sizes', default=','.join(map(str, SUITE_SIZES)), help='Comma-separated numbers of nodes of synthetic maps')
+    parser.add_argument('--output', default=None, help='Save results of the suite as json to the file')
+    parser.add_argument('--compare', default=None, help='Compare results of the suite with an earlier json file')
+
+    args = parser.parse_args()
+
+    if not args.suite:
+        print(json.dumps(bench_ticks(args.map, args.ticks, args.seed, not args.tick_mode, args.optimized), indent=4))
+        return
+
+    suite = run_suite(
+        tuple(args.kinds.split(',')),
+        tuple(int(size) for size in args.sizes.split(',')),
+        args.ticks,
+        args.seed,
+        on_result=lambda result: print(json.dumps(result), flush=True)
+    )
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(suite, file, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            print("\n".join(compare_suites(json.load(file), suite)))
+
+
+if __name__ == "__main__":
+    main()
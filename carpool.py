@@ -0,0 +1,116 @@
+from array import array
+from collections import deque
+from collections.abc import Iterable, Iterator
+
+
+class CarPool:
+    """
+    Cars stored as integer ids into typed arrays of their fields:
+        origin: node the car has left home from,
+        destination: node the car is driving to,
+        route: route id in RouteTable,
+        position: index of the next node of the car in its route,
+        arrival: moment in seconds when the car reaches this node,
+        departure: moment in seconds when the car has started its current trip.
+    Ids of released cars are reused, so adding and releasing a car are O(1).
+    """
+    origin: array
+    destination: array
+    route: array
+    position: array
+    arrival: array
+    departure: array
+    _free: list[int]
+
+    def __init__(self) -> None:
+        self.origin = array('i')
+        self.destination = array('i')
+        self.route = array('i')
+        self.position = array('i')
+        self.arrival = array('i')
+        self.departure = array('i')
+        self._free = []
+
+    def add(self, origin: int, destination: int, route: int, arrival: int = 0, departure: int = 0) -> int:
+        if self._free:
+            car = self._free.pop()
+            self.origin[car] = origin
+            self.destination[car] = destination
+            self.route[car] = route
+            self.position[car] = 0
+            self.arrival[car] = arrival
+            self.departure[car] = departure
+            return car
+
+        self.origin.append(origin)
+        self.destination.append(destination)
+        self.route.append(route)
+        self.position.append(0)
+        self.arrival.append(arrival)
+        self.departure.append(departure)
+        return len(self.origin) - 1
+
+    def add_many(
+        self,
+        amount: int,
+        origin: int,
+        destination: int,
+        route: int,
+        arrival: int = 0,
+        departure: int = 0
+    ) -> list[int]:
+        reused = min(amount, len(self._free))
+        cars = [self.add(origin, destination, route, arrival, departure) for _ in range(reused)]
+
+        new = amount - reused
+        if new > 0:
+            first = len(self.origin)
+            self.origin.extend(array('i', [origin]) * new)
+            self.destination.extend(array('i', [destination]) * new)
+            self.route.extend(array('i', [route]) * new)
+            self.position.extend(array('i', [0]) * new)
+            self.arrival.extend(array('i', [arrival]) * new)
+            self.departure.extend(array('i', [departure]) * new)
+            cars.extend(range(first, first + new))
+
+        return cars
+
+    def release(self, car: int) -> None:
+        self._free.append(car)
+
+    def __len__(self) -> int:
+        return len(self.origin) - len(self._free)
+
+
+ARRIVING_LANE = -1
+
+
+class RoadQueue:
+    """
+    Cars on a road split into lanes by the node they turn to at the end of the road,
+    cars finishing their route there use ARRIVING_LANE.
+    Every lane is a FIFO ordered by arrival, cars leave a lane only from its head.
+    """
+    lanes: dict[int, deque[int]]
+
+    def __init__(self) -> None:
+        self.lanes = {}
+
+    def append(self, car: int, lane: int) -> None:
+        cars = self.lanes.get(lane)
+        if cars is None:
+            cars = self.lanes[lane] = deque()
+        cars.append(car)
+
+    def extend(self, cars: Iterable[int], lane: int) -> None:
+        lane_cars = self.lanes.get(lane)
+        if lane_cars is None:
+            lane_cars = self.lanes[lane] = deque()
+        lane_cars.extend(cars)
+
+    def __iter__(self) -> Iterator[int]:
+        for cars in self.lanes.values():
+            yield from cars
+
+    def __len__(self) -> int:
+        return sum(map(len, self.lanes.values()))
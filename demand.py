@@ -0,0 +1,56 @@
+"""
+Departures of citizens and guests of localities, computed for all localities at once.
+"""
+
+import numpy as np
+
+from distributor import DepartureSchedule
+from graph import Locality
+
+
+class Demand:
+    """
+    Every locality keeps its own fractional remainders of departures, so the totals of a locality
+    follow its own population and profiles and never borrow leftovers of other localities.
+    Arrays are aligned with the list of localities.
+    """
+    localities: list[Locality]
+    daily_natives: np.ndarray
+    native_remainders: np.ndarray
+    guest_remainders: np.ndarray
+
+    _schedule: DepartureSchedule
+    _factors: np.ndarray
+    _citizens_columns: np.ndarray
+    _guests_columns: np.ndarray
+
+    def __init__(self, localities: list[Locality], schedule: DepartureSchedule) -> None:
+        self.localities = localities
+
+        population = np.array([locality.population for locality in localities], dtype=np.float64)
+        emigration_factor = np.array([locality.emigration_factor for locality in localities], dtype=np.float64)
+        self.daily_natives = population * emigration_factor
+
+        self.native_remainders = np.zeros(len(localities))
+        self.guest_remainders = np.zeros(len(localities))
+
+        self._schedule = schedule
+        self._factors, self._citizens_columns, self._guests_columns = schedule.factor_matrix(
+            [locality.idx for locality in localities])
+
+    def departures(self, clock: int, guests: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Numbers of citizens and guests leaving every locality on the tick at the clock,
+        guests are the numbers of guests staying in the localities.
+        """
+        factors = self._factors[self._schedule.index(clock)]
+
+        natives = self.native_remainders + self.daily_natives * factors[self._citizens_columns]
+        leaving_natives = np.floor(natives)
+        self.native_remainders = natives - leaving_natives
+
+        guests = self.guest_remainders + guests * factors[self._guests_columns]
+        leaving_guests = np.floor(guests)
+        self.guest_remainders = guests - leaving_guests
+
+        return leaving_natives.astype(np.int64), leaving_guests.astype(np.int64)
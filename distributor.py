@@ -1,5 +1,17 @@
+"""
+Departure profiles: the share of the daily departures of a locality leaving per hour at every time of the day.
+
+A DepartureSchedule turns profiles into tables of factors for every tick of the day,
+so the simulation reads a table entry per tick instead of evaluating a density.
+"""
+
+from __future__ import annotations
+from abc import ABC, abstractmethod
 from datetime import timedelta
-from scipy.stats import norm
+from math import gcd
+import json
+
+import numpy as np
 
 
 SIGMA = 1.8
@@ -7,15 +19,160 @@ CITIZENS_MU = 8
 GUESTS_MU = 18
 
 HOUR = 3600
+HOURS = 24
+DAY_SECONDS = HOURS * HOUR
+
+
+class DepartureProfile(ABC):
+    @abstractmethod
+    def density(self, hours: np.ndarray) -> np.ndarray:
+        """
+        Share of daily departures per hour at the given hours of the day.
+        """
+
+
+class GaussianProfile(DepartureProfile):
+    """
+    Normal density around the peak hour, as scipy.stats.norm.pdf computes it.
+    """
+    mu: float
+    sigma: float
+
+    def __init__(self, mu: float, sigma: float = SIGMA) -> None:
+        self.mu = mu
+        self.sigma = sigma
+
+    def density(self, hours: np.ndarray) -> np.ndarray:
+        z = (np.asarray(hours, dtype=np.float64) - self.mu) / self.sigma
+        return np.exp(-z ** 2 / 2.0) / np.sqrt(2 * np.pi) / self.sigma
+
+
+class EmpiricalProfile(DepartureProfile):
+    """
+    Departure counts of the 24 hours of a day, normalized to shares.
+    The density is interpolated linearly between the middles of the hours around the clock,
+    so it has no jumps at hour borders and still integrates to one over the day.
+    """
+    shares: np.ndarray
+
+    def __init__(self, counts: list[float] | np.ndarray) -> None:
+        counts = np.asarray(counts, dtype=np.float64)
+        if counts.shape != (HOURS,) or (counts < 0).any() or counts.sum() == 0:
+            raise ValueError("Departure counts must be 24 non-negative numbers, not all zeros")
+
+        self.shares = counts / counts.sum()
+
+    @classmethod
+    def from_file(cls, filepath: str) -> EmpiricalProfile:
+        """
+        Sums rows of 24 comma-separated hourly counts, e.g. one row for every counted day.
+        """
+        # analysis reads the same layout as hourly statistics files
+        from analysis import load_hourly_factors
+
+        return cls(load_hourly_factors(filepath).sum(axis=0))
+
+    def density(self, hours: np.ndarray) -> np.ndarray:
+        return np.interp(hours, np.arange(HOURS) + 0.5, self.shares, period=HOURS)
+
+
+CITIZENS_PROFILE = GaussianProfile(CITIZENS_MU)
+GUESTS_PROFILE = GaussianProfile(GUESTS_MU)
+
+
+class DepartureSchedule:
+    """
+    Factors of departing citizens and guests for every tick of the day, per locality if it has own profiles.
+    The clock of the simulation moves by delta from a multiple of gcd(delta, day),
+    so table entries are kept for the moments at this step.
+    """
+    step: int
+
+    _default: tuple[list[float], list[float]]
+    _localities: dict[int, tuple[list[float], list[float]]]
+
+    def __init__(
+        self,
+        delta: timedelta,
+        citizens: DepartureProfile = CITIZENS_PROFILE,
+        guests: DepartureProfile = GUESTS_PROFILE,
+        localities: dict[int, tuple[DepartureProfile | None, DepartureProfile | None]] | None = None
+    ) -> None:
+        """
+        localities maps a locality to its citizens and guests profiles, None keeps the common one.
+        """
+        delta_seconds = delta // timedelta(seconds=1)
+        self.step = gcd(delta_seconds, DAY_SECONDS)
+
+        hours = np.arange(0, DAY_SECONDS, self.step) / HOUR
+        dx = delta_seconds / HOUR
+
+        tables: dict[DepartureProfile, list[float]] = {}
+
+        def table(profile: DepartureProfile) -> list[float]:
+            if profile not in tables:
+                tables[profile] = (profile.density(hours) * dx).tolist()
+            return tables[profile]
+
+        self._default = (table(citizens), table(guests))
+        self._localities = {
+            idx: (
+                self._default[0] if locality_citizens is None else table(locality_citizens),
+                self._default[1] if locality_guests is None else table(locality_guests)
+            )
+            for idx, (locality_citizens, locality_guests) in (localities or {}).items()
+        }
+
+    @classmethod
+    def from_file(cls, filepath: str, delta: timedelta) -> DepartureSchedule:
+        """
+        Json of profiles given by 24 hourly counts:
+        {"citizens": [...], "guests": [...], "localities": {"idx": {"citizens": [...], "guests": [...]}}},
+        every key is optional and missing profiles are the Gaussian ones.
+        """
+        with open(filepath, 'r', encoding='utf-8') as file:
+            spec = json.load(file)
+
+        def profile(counts: list[float] | None) -> EmpiricalProfile | None:
+            return None if counts is None else EmpiricalProfile(counts)
+
+        return cls(
+            delta,
+            profile(spec.get('citizens')) or CITIZENS_PROFILE,
+            profile(spec.get('guests')) or GUESTS_PROFILE,
+            {
+                int(idx): (profile(locality.get('citizens')), profile(locality.get('guests')))
+                for idx, locality in spec.get('localities', {}).items()
+            }
+        )
+
+    def factor_matrix(self, locality_idxs: list[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Distinct tables of the localities as columns of a matrix indexed by index(clock),
+        and the columns of citizens and guests tables of every locality.
+        """
+        columns: dict[int, int] = {}
+        tables = []
+
+        def column(table: list[float]) -> int:
+            if id(table) not in columns:
+                columns[id(table)] = len(tables)
+                tables.append(table)
+            return columns[id(table)]
+
+        citizens, guests = zip(*(self.tables(idx) for idx in locality_idxs)) if locality_idxs else ((), ())
+        citizens_columns = np.array([column(table) for table in citizens], dtype=np.int64)
+        guests_columns = np.array([column(table) for table in guests], dtype=np.int64)
 
+        matrix = np.array(tables, dtype=np.float64).T if tables else np.zeros((DAY_SECONDS // self.step, 0))
+        return np.ascontiguousarray(matrix), citizens_columns, guests_columns
 
-def get_leaving_citizens_factor(time: timedelta, delta: timedelta) -> float:
-    hours = time.seconds / HOUR
-    dx = delta.seconds / HOUR
-    return norm.pdf(hours, loc=CITIZENS_MU, scale=SIGMA) * dx
+    def index(self, clock: int) -> int:
+        return clock // self.step
 
+    def tables(self, locality_idx: int) -> tuple[list[float], list[float]]:
+        """
+        Tables of citizens and guests factors of the locality, indexed by index(clock).
+        """
+        return self._localities.get(locality_idx, self._default)
 
-def get_leaving_guests_factor(time: timedelta, delta: timedelta) -> float:
-    hours = time.seconds / HOUR
-    dx = delta.seconds / HOUR
-    return norm.pdf(hours, loc=GUESTS_MU, scale=SIGMA) * dx
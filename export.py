@@ -0,0 +1,170 @@
+"""
+Offscreen export of a simulation to PNG frames or a video.
+
+The simulation only copies workloads of roads into a frame buffer every stride ticks,
+full buffers go through a bounded queue to a background process, which lays out the graph
+and draws them with the Agg canvas.
+If the renderer falls behind, batches which do not fit into the queue are dropped and counted,
+so the simulation never waits for it, unless lossless export is asked for.
+"""
+
+from multiprocessing import Pipe, Process, Queue
+from multiprocessing.connection import Connection
+from queue import Full
+import os
+
+import numpy as np
+from matplotlib.animation import FFMpegWriter, PillowWriter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from graph import Graph
+from simulation import Simulation
+from visualization import FIGURE_SIZE, NetworkArtists, road_geometry
+
+
+DPI = 50
+VIDEO_FPS = 30
+BATCH_FRAMES = 64
+QUEUED_BATCHES = 2
+
+
+def _is_gif(video_path: str) -> bool:
+    return video_path.lower().endswith('.gif')
+
+
+def _video_writer(video_path: str, fps: int) -> FFMpegWriter | PillowWriter:
+    return PillowWriter(fps=fps) if _is_gif(video_path) else FFMpegWriter(fps=fps)
+
+
+def _render_frames(
+    batches: Queue,
+    connection: Connection,
+    nodes: int,
+    from_idx: np.ndarray,
+    to_idx: np.ndarray,
+    directory: str | None,
+    video_path: str | None,
+    video_fps: int
+) -> None:
+    figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+    FigureCanvasAgg(figure)
+    artists = NetworkArtists(figure, *road_geometry(nodes, from_idx, to_idx))
+
+    writer = None
+    if video_path is not None:
+        writer = _video_writer(video_path, video_fps)
+        writer.setup(figure, video_path, dpi=DPI)
+
+    frame = 0
+    while (batch := batches.get()) is not None:
+        for seconds, workloads in zip(*batch):
+            artists.update(workloads.astype(np.float64), seconds)
+
+            if directory is not None:
+                figure.savefig(os.path.join(directory, f'frame_{frame:06d}.png'), dpi=DPI)
+            if writer is not None:
+                writer.grab_frame()
+            frame += 1
+
+    if writer is not None:
+        writer.finish()
+
+    connection.send(frame)
+    connection.close()
+
+
+class FrameExporter:
+    """
+    Exports workloads of roads every stride ticks as PNG frames into a directory,
+    as a video (mp4 and other ffmpeg formats, or gif), or both.
+    Workloads are kept as float16 in the buffer, which is plenty for colors and labels.
+    Lossless export waits for the renderer instead of dropping frames.
+    """
+    stride: int
+    frames: int
+    dropped: int
+    lossless: bool
+
+    def __init__(
+        self,
+        graph: Graph,
+        directory: str | None = None,
+        video_path: str | None = None,
+        stride: int = 20,
+        video_fps: int = VIDEO_FPS,
+        lossless: bool = False
+    ) -> None:
+        if directory is None and video_path is None:
+            raise ValueError("Frames need a directory or a video path")
+        if video_path is not None and not _is_gif(video_path) and not FFMpegWriter.isAvailable():
+            raise RuntimeError("ffmpeg is not found, save the video as gif or export PNG frames")
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.stride = stride
+        self.frames = 0
+        self.dropped = 0
+        self.lossless = lossless
+
+        self._graph = graph
+        self._moments = np.zeros(BATCH_FRAMES, dtype=np.int64)
+        self._workloads = np.zeros((BATCH_FRAMES, len(graph.edges)), dtype=np.float16)
+        self._size = 0
+
+        store = graph.edge_store
+        self._batches = Queue(maxsize=QUEUED_BATCHES)
+        self._connection, worker_connection = Pipe()
+        self._process = Process(
+            target=_render_frames,
+            args=(
+                self._batches, worker_connection, len(graph.nodes),
+                store.from_idx[:len(store)], store.to_idx[:len(store)], directory, video_path, video_fps
+            ),
+            daemon=True
+        )
+        self._process.start()
+
+    def attach(self, simulation: Simulation) -> None:
+        simulation.tick_hooks.append(self.on_tick)
+
+    def on_tick(self, simulation: Simulation) -> None:
+        if simulation.tick % self.stride == 0:
+            self.snapshot(simulation.clock)
+
+    def snapshot(self, seconds: int) -> None:
+        """
+        Adds a frame with the current workloads of roads at the given time of the day.
+        """
+        self._moments[self._size] = seconds
+        self._workloads[self._size] = self._graph.edge_store.workloads()
+        self._size += 1
+
+        if self._size == BATCH_FRAMES:
+            self._send()
+
+    def _send(self) -> None:
+        if not self._size:
+            return
+
+        batch = (self._moments[:self._size].copy(), self._workloads[:self._size].copy())
+        if self.lossless:
+            self._batches.put(batch)
+        else:
+            try:
+                self._batches.put_nowait(batch)
+            except Full:
+                self.dropped += self._size
+
+        self._size = 0
+
+    def close(self) -> int:
+        """
+        Waits until every queued frame is rendered, returns the number of rendered frames.
+        """
+        self._send()
+        self._batches.put(None)
+        self.frames = self._connection.recv()
+        self._process.join()
+        return self.frames
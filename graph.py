@@ -1,29 +1,182 @@
 """Graph classes"""
 
 from __future__ import annotations
-from typing import Generator, Iterable
+from typing import Iterable, TYPE_CHECKING
 from datetime import timedelta
 from random import randint
-from math import gcd
+from math import gcd, lcm
+from functools import lru_cache
+
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from pathfinder import RouteTable
+
+
+DAY_SECONDS = 24 * 60 * 60
+DEFAULT_LAST_UPDATE = 10000007 * DAY_SECONDS
+DEFAULT_TIME_LAST_UPDATE = timedelta(seconds=DEFAULT_LAST_UPDATE)
+COMPATIBILITY_CACHE_SIZE = 1 << 16
+MAX_HYPERPERIOD = 1 << 14
+OUT_LIGHT = 1
+
+
+class EdgeStore:
+    """
+    Attributes of roads kept in contiguous arrays indexed by edge id,
+    so whole-network metrics are computed with vectorized reductions.
+    """
+    from_idx: np.ndarray
+    to_idx: np.ndarray
+    speed_limit: np.ndarray
+    length: np.ndarray
+    width: np.ndarray
+    volume: np.ndarray
+    cars: np.ndarray
+    changed: np.ndarray
+    _size: int
+
+    def __init__(self, capacity: int = 0) -> None:
+        capacity = max(capacity, 1)
+        self._size = 0
+
+        self.from_idx = np.zeros(capacity, dtype=np.int64)
+        self.to_idx = np.zeros(capacity, dtype=np.int64)
+        self.speed_limit = np.zeros(capacity, dtype=np.float64)
+        self.length = np.zeros(capacity, dtype=np.float64)
+        self.width = np.zeros(capacity, dtype=np.float64)
+        self.volume = np.zeros(capacity, dtype=np.float64)
+        self.cars = np.zeros(capacity, dtype=np.int64)
+        self.changed = np.zeros(capacity, dtype=np.bool_)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        from_idx: np.ndarray,
+        to_idx: np.ndarray,
+        speed_limit: np.ndarray,
+        length: np.ndarray,
+        width: np.ndarray,
+        volume: np.ndarray | None = None
+    ) -> EdgeStore:
+        """
+        Store over the given arrays of road attributes, they are used without copying,
+        so read-only (e.g. memory-mapped) arrays can be shared between processes.
+        Arrays of cars are always allocated.
+        """
+        store = cls.__new__(cls)
+        store._size = len(from_idx)
+
+        store.from_idx = from_idx
+        store.to_idx = to_idx
+        store.speed_limit = speed_limit
+        store.length = length
+        store.width = width
+        store.volume = length * width if volume is None else volume
+        store.cars = np.zeros(store._size, dtype=np.int64)
+        store.changed = np.zeros(store._size, dtype=np.bool_)
+
+        return store
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self.cars)
+        for name in ("from_idx", "to_idx", "speed_limit", "length", "width", "volume", "cars", "changed"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(
+        self,
+        from_idx: int,
+        to_idx: int,
+        speed_limit: float,
+        length: float,
+        width: float
+    ) -> int:
+        if self._size == len(self.cars):
+            self._grow()
+
+        idx = self._size
+        self._size += 1
+
+        self.from_idx[idx] = from_idx
+        self.to_idx[idx] = to_idx
+        self.speed_limit[idx] = speed_limit
+        self.length[idx] = length
+        self.width[idx] = width
+        self.volume[idx] = length * width
+        self.cars[idx] = 0
+
+        return idx
+
+    def workloads(self) -> np.ndarray:
+        return self.cars[:self._size] / self.volume[:self._size]
+
+    def nodes_workloads(self, nodes_count: int) -> np.ndarray:
+        """
+        Sum of workloads of output roads for every node.
+        """
+        return np.bincount(
+            self.from_idx[:self._size],
+            weights=self.workloads(),
+            minlength=nodes_count
+        )
 
+    def pop_changed_nodes(self) -> np.ndarray:
+        """
+        Nodes whose output roads changed their number of cars since the previous call.
+        """
+        changed = self.changed[:self._size]
+        nodes = np.unique(self.from_idx[:self._size][changed])
+        changed[:] = False
+        return nodes
 
-from numpy.random import choice
+    def __len__(self) -> int:
+        return self._size
 
 
-DEFAULT_TIME_LAST_UPDATE = timedelta(days=10000007)
+class Edge:
+    """
+    View of a single road inside EdgeStore.
+    """
+    _store: EdgeStore
+    _idx: int
 
+    def __init__(
+        self,
+        speed_limit: float,
+        length: float,
+        width: float,
+        store: EdgeStore | None = None,
+        from_idx: int = -1,
+        to_idx: int = -1
+    ):
+        self._store = EdgeStore() if store is None else store
+        self._idx = self._store.add(from_idx, to_idx, speed_limit, length, width)
+
+    @classmethod
+    def from_store(cls, store: EdgeStore, idx: int) -> Edge:
+        """
+        View of a road which is already in the store.
+        """
+        edge = cls.__new__(cls)
+        edge._store = store
+        edge._idx = idx
+        return edge
 
-class Edge:
-    _speed_limit: float
-    _length: float
-    _width: float
-    _cars: int
+    @property
+    def idx(self) -> int:
+        return self._idx
+
+    @property
+    def from_idx(self) -> int:
+        return int(self._store.from_idx[self._idx])
 
-    def __init__(self, speed_limit: float, length: float, width: float):
-        self._speed_limit = speed_limit
-        self._length = length
-        self._width = width
-        self._cars = 0
+    @property
+    def to_idx(self) -> int:
+        return int(self._store.to_idx[self._idx])
 
     @property
     def workload(self) -> float:
@@ -31,27 +184,41 @@ class Edge:
 
     @property
     def volume(self) -> float:
-        return self._length * self._width
+        return float(self._store.volume[self._idx])
 
     @property
     def cars(self) -> int:
-        return self._cars
+        return int(self._store.cars[self._idx])
 
     @property
     def speed_limit(self) -> float:
-        return self._speed_limit
+        return float(self._store.speed_limit[self._idx])
 
     @property
     def length(self) -> float:
-        return self._length
+        return float(self._store.length[self._idx])
 
     @property
     def width(self) -> float:
-        return self._width
+        return float(self._store.width[self._idx])
+
+    def admit_cars(self, amount: int) -> int:
+        """
+        Adds up to amount cars, as many as the road can hold.
+        Returns the number of added cars.
+        """
+        old_cars = self.cars
+        return self.update_cars(old_cars + amount) - old_cars
 
     def update_cars(self, new_cars: int) -> int:
-        self._cars = min(self.volume, new_cars)
-        return self._cars
+        old_cars = self.cars
+        self._store.cars[self._idx] = min(self.volume, new_cars)
+
+        cars = self.cars
+        if cars != old_cars:
+            self._store.changed[self._idx] = True
+
+        return cars
 
 
 class Node:
@@ -70,15 +237,25 @@ class Node:
         to: int,
         speed_limit: int,
         road_length: float,
-        road_width: float
+        road_width: float,
+        store: EdgeStore | None = None
     ) -> None:
         if to in self.output_roads:
             raise ValueError(
                 f"Road between nodes {self.idx} and {to} already exists.")
 
-        self.output_roads[to] = Edge(speed_limit, road_length, road_width)
+        self.output_roads[to] = Edge(speed_limit, road_length, road_width, store, self.idx, to)
         graph[to].input_nodes.append(self.idx)
 
+    def __getattr__(self, name: str):
+        # roads of nodes of a graph built from a store are views created on first access
+        graph = self.__dict__.get('_roads_graph')
+        if graph is None or name not in ('output_roads', 'input_nodes'):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        graph._build_roads(self, name)
+        return self.__dict__[name]
+
     def __getitem__(self, idx: int) -> Edge:
         return self.output_roads[idx]
 
@@ -102,87 +279,174 @@ class Locality(Node):
         self.popularity_factor = popularity_factor
 
 
+@lru_cache(maxsize=COMPATIBILITY_CACHE_SIZE)
+def _are_compatible(green1: int, red1: int, green2: int, red2: int) -> bool:
+    """
+    The first light is green on [k*T1, k*T1 + green1), the second one on [m*T2 + red2, (m+1)*T2).
+    Differences between starts of these intervals take every value congruent to -red2 modulo
+    gcd(T1, T2), and the intervals overlap iff one of the differences lies in (-green1, green2).
+    Initial lights do not take part in the check, so a light is keyed by its (green, red) times only.
+    """
+    d = gcd(green1 + red1, green2 + red2)
+
+    if d > green1 + green2:
+        return True
+
+    # the smallest difference greater than -green1
+    lowest = 1 - green1
+    difference = lowest + (-red2 - lowest) % d
+
+    return difference >= green2
+
+
 class StopLight:
-    green_time: timedelta
-    red_time: timedelta
+    """
+    Times are kept in integer seconds,
+    green_time, red_time and time_last_update are their timedelta views.
+    """
+    green: int
+    red: int
 
-    _future_red_time: timedelta
-    _future_green_time: timedelta
+    _future_green: int
+    _future_red: int
 
-    time_last_update: timedelta
+    last_update: int
 
     initial_light: bool | None  # True - green | False - red
 
     def __init__(self, green_time: int, red_time: int) -> None:
-        self.time_last_update = DEFAULT_TIME_LAST_UPDATE
+        self.last_update = DEFAULT_LAST_UPDATE
         self.initial_light = None
 
-        self.green_time = timedelta(seconds=green_time)
-        self.red_time = timedelta(seconds=red_time)
+        self.green = green_time
+        self.red = red_time
 
-        self._future_green_time = timedelta()
-        self._future_red_time = timedelta()
+        self._future_green = 0
+        self._future_red = 0
 
-    def is_compatible(self, other: StopLight) -> bool:
-        T1 = (self.red_time + self.green_time).seconds
-        T2 = (other.red_time + other.green_time).seconds
+    @property
+    def green_time(self) -> timedelta:
+        return timedelta(seconds=self.green)
 
-        d = gcd(T1, T2)
+    @property
+    def red_time(self) -> timedelta:
+        return timedelta(seconds=self.red)
 
-        if d > self.green_time.seconds + other.green_time.seconds:
-            return True
+    @property
+    def time_last_update(self) -> timedelta:
+        return timedelta(seconds=self.last_update)
 
-        max_checks = (T1 * T2) // d
+    def is_compatible(self, other: StopLight) -> bool:
+        return _are_compatible(self.green, self.red, other.green, other.red)
 
-        for k in range(0, max_checks + 1):
-            t1_start = k * T1
-            t1_end = t1_start + self.green_time.seconds
+    @property
+    def offset(self) -> int:
+        """
+        Moment when the current cycle of the light started.
+        """
+        return 0 if self.last_update == DEFAULT_LAST_UPDATE else self.last_update
 
-            m = (t1_start - other.red_time.seconds) // T2
-            for delta in [-1, 0, 1]:
-                current_m = m + delta
-                if current_m < 0:
-                    continue
+    def _has_pending_times(self) -> bool:
+        return self._future_green != self.green and self._future_red != self.red
 
-                t2_start = current_m * T2 + other.red_time.seconds
-                t2_end = t2_start + other.green_time.seconds
+    def planned_times(self) -> tuple[int, int]:
+        """
+        Green and red times after the pending switch, the current ones if there is no switch.
+        """
+        if self.pending_switch() is None:
+            return self.green, self.red
+        return self._future_green, self._future_red
 
-                if not (t1_end <= t2_start or t2_end <= t1_start):
-                    return False
+    def pending_switch(self) -> int | None:
+        """
+        Moment when new times become active, None if there are no such times.
+        """
+        if self.last_update == DEFAULT_LAST_UPDATE or not self._has_pending_times():
+            return None
+        return self.last_update
 
-        return True
+    def commit_times(self, time: int) -> None:
+        """
+        Activates new times if their moment has come.
+        """
+        if time >= self.last_update and self._has_pending_times():
+            self.green = self._future_green
+            self.red = self._future_red
 
-    def update_times(self, time: timedelta, new_green_time: int, new_red_time: int):
-        full_cycle = (self.green_time + self.red_time).seconds
+    def phase_table(self) -> np.ndarray:
+        """
+        Lights for every second of the cycle counted from the offset, True is green.
+        """
+        table = np.zeros(self.green + self.red, dtype=np.bool_)
+        if self.initial_light:
+            table[:self.green] = True
+        else:
+            table[self.red:] = True
+        return table
+
+    def plan(self) -> dict[str, int | bool | None]:
+        switch_at = self.pending_switch()
+        return {
+            "green": self.green,
+            "red": self.red,
+            "offset": self.offset % (self.green + self.red),
+            "initially_green": bool(self.initial_light),
+            "next_green": None if switch_at is None else self._future_green,
+            "next_red": None if switch_at is None else self._future_red,
+            "switch_at": switch_at
+        }
 
-        self._future_green_time = timedelta(seconds=new_green_time)
-        self._future_red_time = timedelta(seconds=new_red_time)
+    def update_times(self, time: int, new_green_time: int, new_red_time: int):
+        full_cycle = self.green + self.red
 
-        self.time_last_update = timedelta(
-            seconds=(time.seconds + full_cycle) // full_cycle * full_cycle)
+        self._future_green = new_green_time
+        self._future_red = new_red_time
 
-    def is_green(self, time: timedelta) -> bool:
-        if (time >= self.time_last_update
-            and self._future_green_time != self.green_time
-                and self._future_red_time != self.red_time):
+        self.last_update = (time % DAY_SECONDS + full_cycle) // full_cycle * full_cycle
 
-            self.green_time = self._future_green_time
-            self.red_time = self._future_red_time
+    def is_green(self, time: int) -> bool:
+        self.commit_times(time)
 
-        if self.time_last_update != DEFAULT_TIME_LAST_UPDATE:
-            time -= self.time_last_update
+        mod = (time - self.offset) % (self.green + self.red)
+        if self.initial_light:
+            return mod < self.green
+        return mod >= self.red
 
-        mod = time % (self.green_time + self.red_time)
+    def next_green(self, time: int) -> int:
+        """
+        Earliest moment not before time when the light can be green.
+        A pending switch to new times is also such a moment.
+        """
+        full_cycle = self.green + self.red
+        mod = (time - self.offset) % full_cycle
         if self.initial_light:
-            return mod < self.green_time
-        return mod >= self.red_time
+            wait = 0 if mod < self.green else full_cycle - mod
+        else:
+            wait = 0 if mod >= self.red else self.red - mod
+
+        moment = time + wait
+        if time < self.last_update and self._has_pending_times():
+            moment = min(moment, self.last_update)
+
+        return moment
 
 
 class Junction(Node):
+    """
+    Lights of the junction are compiled into a phase table with a bitmask of green lights
+    for every second of their hyperperiod, OUT_LIGHT is the bit of out_stoplight
+    and light_bits keeps bits of the others.
+    The table is rebuilt only when stoplights get new times or switch to them.
+    """
     bandwidth: int
     out_stoplight: StopLight | None
     stoplights: dict[int, StopLight]
     dependencies: dict[int, list[int]]
+    light_bits: dict[int, int]
+
+    _phase_table: list[int] | None
+    _hyperperiod: int
+    _switch_at: int
 
     def _set_initial_lights(self, adjacent_node_idx: int, initial_light: bool) -> None:
         cur_stoplight = self.stoplights[adjacent_node_idx]
@@ -211,9 +475,14 @@ class Junction(Node):
         bandwidth: int,
         out_stoplight: tuple[int],
         stoplights: dict[int, tuple[int]],
-        dependencies: dict[int, list[int]] = []
+        dependencies: dict[int, list[int]] = [],
+        rng: np.random.Generator | None = None,
+        initial_lights: dict[int, bool] | None = None
     ) -> None:
-
+        """
+        initial_lights are lights of stoplights which have already been checked against dependencies,
+        e.g. by the map compiler, they are taken as they are. Stoplights without initial lights get random ones.
+        """
         super().__init__(idx)
         self.bandwidth = bandwidth
         self.out_stoplight = StopLight(*out_stoplight)
@@ -222,16 +491,81 @@ class Junction(Node):
             for node_idx, args in stoplights.items()
         }
         self.dependencies = dependencies
-        if self.dependencies and self.stoplights:
+        if initial_lights is not None:
+            for node_idx, initial_light in initial_lights.items():
+                self.stoplights[node_idx].initial_light = initial_light
+        elif self.dependencies and self.stoplights:
             self._set_initial_lights(list(self.stoplights.keys())[0], True)
 
         for stoplight in self.stoplights.values():
             if stoplight.initial_light is None:
-                stoplight.initial_light = randint(0, 1) == 1
+                stoplight.initial_light = (randint(0, 1) if rng is None else rng.integers(2)) == 1
+
+        self.light_bits = {node_idx: OUT_LIGHT << bit for bit, node_idx in enumerate(self.stoplights, 1)}
+
+        self._phase_table = None
+        self._hyperperiod = 0
+        self._switch_at = -1
+
+    def _lights(self) -> list[tuple[StopLight, int]]:
+        return [(self.out_stoplight, OUT_LIGHT)] + [
+            (self.stoplights[node_idx], bit) for node_idx, bit in self.light_bits.items()
+        ]
+
+    def _compile_phases(self, time: int) -> None:
+        """
+        Switches stoplights to new times, whose moment has come, and rebuilds the phase table.
+        The table is not built if the hyperperiod of the lights is too long
+        or the lights do not fit into a 64-bit mask.
+        """
+        lights = self._lights()
+        for stoplight, _ in lights:
+            stoplight.commit_times(time)
+
+        switches = [
+            moment for stoplight, _ in lights
+            if (moment := stoplight.pending_switch()) is not None
+        ]
+        self._switch_at = min(switches, default=DEFAULT_LAST_UPDATE)
+
+        self._hyperperiod = lcm(*(stoplight.green + stoplight.red for stoplight, _ in lights))
+        if self._hyperperiod > MAX_HYPERPERIOD or len(lights) > 63:
+            self._phase_table = None
+            return
+
+        table = np.zeros(self._hyperperiod, dtype=np.int64)
+        for stoplight, bit in lights:
+            cycle = stoplight.green + stoplight.red
+            phases = np.tile(stoplight.phase_table(), self._hyperperiod // cycle)
+            table += np.roll(phases, stoplight.offset % cycle) * bit
+
+        self._phase_table = table.tolist()
+
+    def green_lights(self, time: int) -> int:
+        """
+        Bitmask of stoplights which are green at time.
+        """
+        if time >= self._switch_at:
+            self._compile_phases(time)
+
+        if self._phase_table is None:
+            return sum(bit for stoplight, bit in self._lights() if stoplight.is_green(time))
+
+        return self._phase_table[time % self._hyperperiod]
+
+    def signal_plan(self) -> dict:
+        """
+        Times of all stoplights of the junction, stoplights are keyed by their adjacent nodes.
+        """
+        return {
+            "idx": self.idx,
+            "out_stoplight": self.out_stoplight.plan(),
+            "stoplights": {node_idx: stoplight.plan() for node_idx, stoplight in self.stoplights.items()}
+        }
 
     def update_stoplight_times(
         self,
-        time: timedelta,
+        time: int,
         new_green_time: int,
         new_red_time: int,
         adjacent_node_idx: int | None = None
@@ -239,54 +573,63 @@ class Junction(Node):
         """
         If optional argument adjacent_node_idx is None, time will be updated on the out_stoplight,
         Otherwise time will be updated on the stoplight between nodes self.idx and adjacent_node_idx.
+        time is in seconds, new times start with the next cycle after it.
         """
+        # the phase table is rebuilt on the next lookup
+        self._switch_at = -1
+
         if adjacent_node_idx is None:
             self.out_stoplight.update_times(time, new_green_time, new_red_time)
             return
 
-        tmp_stoplight = StopLight(new_green_time, new_red_time)
-
-        if adjacent_node_idx in self.dependencies:
-            for opposite_node_idx in self.dependencies[adjacent_node_idx]:
-                opposite_stoplight = self.stoplights[opposite_node_idx]
-
-                if not tmp_stoplight.is_compatible(opposite_stoplight):
-                    raise ValueError(
-                        f"New stoplight {adjacent_node_idx} is not compatible with the stoplight to {opposite_node_idx}")
+        opposite_node_idx = self.incompatible_dependency(adjacent_node_idx, new_green_time, new_red_time)
+        if opposite_node_idx is not None:
+            raise ValueError(
+                f"New stoplight {adjacent_node_idx} is not compatible with the stoplight to {opposite_node_idx}")
 
         self.stoplights[adjacent_node_idx].update_times(time, new_green_time, new_red_time)
 
+    def incompatible_dependency(self, adjacent_node_idx: int, new_green_time: int, new_red_time: int) -> int | None:
+        """
+        First node whose stoplight depends on the stoplight to adjacent_node_idx and is not compatible
+        with its new times, None if there is no such node.
+        Stoplights with a pending switch are checked with the times they switch to.
+        """
+        if adjacent_node_idx not in self.dependencies:
+            return None
 
-class Car:
-    from_node_idx: int
-    dest_node_idx: int
-    cur_node_idx: int | None
-    cur_edge: Edge | None
-    cur_path: list[Node]
-    time_reaching_node: timedelta | None
-    previous_node: Node | None
+        for opposite_node_idx in self.dependencies[adjacent_node_idx]:
+            if not _are_compatible(
+                new_green_time, new_red_time, *self.stoplights[opposite_node_idx].planned_times()
+            ):
+                return opposite_node_idx
 
-    def __init__(self, from_node: int, dest_node: int, path: list[Node] = []):
-        self.from_node_idx = from_node
-        self.dest_node_idx = dest_node
-        self.cur_node_idx = from_node
-        self.cur_edge: Edge | None = None
-        self.cur_path: list[Node] = path
-        self.time_reaching_node: timedelta | None = None
-        self.previous_node = None
+        return None
 
 
 class Graph:
     _graph: list[Node]
+    _edges: list[Edge | None]
+    _edge_store: EdgeStore
+    # set while some views of roads of the store have not been created yet
+    _lazy_edges: bool
+    _edge_offsets: np.ndarray | None
+    _input_edges: tuple[np.ndarray, np.ndarray] | None
 
-    def __init__(self, nodes: list[tuple], edges: list[tuple]) -> None:
+    def __init__(
+        self,
+        nodes: list[tuple],
+        edges: list[tuple],
+        rng: np.random.Generator | None = None
+    ) -> None:
         """
         nodes[i][0] = type: str
         types:
             "junction": (
                 [0]bandwidth: int
                 [1]out-stoplight: (green-time: int, red-time: int),
-                [2]in-stoplights: {node-idx: (green-time: int, red-time: int)}
+                [2]in-stoplights: {node-idx: (green-time: int, red-time: int)},
+                [3]dependencies (optional): {node-idx: [node-idx]}
             )
             "locality": (
                 [0]population: int,
@@ -300,6 +643,7 @@ class Graph:
             [3]length: float,
             [4]width: float
         )
+        rng is used for random initial lights, the global random state is used if it is None.
         """
         self._graph = []
         for idx, node_args in enumerate(nodes):
@@ -313,10 +657,69 @@ class Graph:
             if not class_type:
                 raise ValueError("Unknown type of node.")
 
-            self._graph.append(class_type(idx, *node_args[1:]))
+            if class_type is Junction:
+                self._graph.append(Junction(idx, *node_args[1:], rng=rng))
+            else:
+                self._graph.append(class_type(idx, *node_args[1:]))
+
+        # edge ids follow the order of nodes, so they match the order of self.edges
+        self._edge_store = EdgeStore(len(edges))
+        for edge in sorted(edges, key=lambda edge: edge[0]):
+            self._graph[edge[0]].build_road(self._graph, *edge[1:], store=self._edge_store)
+
+        self._edges = [edge for node in self._graph for _, edge in node]
+        self._lazy_edges = False
+
+    @classmethod
+    def from_store(cls, nodes: list[Node], store: EdgeStore) -> Graph:
+        """
+        Graph of the given nodes without roads and of the roads in the store,
+        roads of the store must be sorted by their from nodes.
+        Edge views, output roads and input nodes are created on first access,
+        so a large compiled map is ready without a Python object per road.
+        """
+        graph = cls.__new__(cls)
+        graph._graph = nodes
+        graph._edge_store = store
+        graph._edges = [None] * len(store)
+        graph._lazy_edges = True
+        graph._edge_offsets = np.searchsorted(store.from_idx[:len(store)], np.arange(len(nodes) + 1))
+        graph._input_edges = None
+
+        for node in nodes:
+            del node.output_roads, node.input_nodes
+            node._roads_graph = graph
+
+        return graph
+
+    def _edge(self, idx: int) -> Edge:
+        edge = self._edges[idx]
+        if edge is None:
+            edge = self._edges[idx] = Edge.from_store(self._edge_store, idx)
+        return edge
+
+    def _build_roads(self, node: Node, name: str) -> None:
+        """
+        Creates output roads or input nodes of a node of a graph built from a store.
+        """
+        store = self._edge_store
+
+        if name == 'output_roads':
+            start, end = self._edge_offsets[node.idx:node.idx + 2].tolist()
+            node.output_roads = {
+                to_idx: self._edge(idx) for idx, to_idx in enumerate(store.to_idx[start:end].tolist(), start)
+            }
+            return
+
+        if self._input_edges is None:
+            # roads sorted by their to nodes, the order of from nodes is kept for every to node
+            order = np.argsort(store.to_idx[:len(store)], kind='stable')
+            offsets = np.searchsorted(store.to_idx[:len(store)][order], np.arange(len(self._graph) + 1))
+            self._input_edges = (order, offsets)
 
-        for edge in edges:
-            self._graph[edge[0]].build_road(self._graph, *edge[1:])
+        order, offsets = self._input_edges
+        start, end = offsets[node.idx:node.idx + 2].tolist()
+        node.input_nodes = store.from_idx[order[start:end]].tolist()
 
     @property
     def nodes(self) -> list[Node]:
@@ -324,7 +727,16 @@ class Graph:
 
     @property
     def edges(self) -> list[Edge]:
-        return sum([[edge for _, edge in node] for node in self.nodes], start=[])
+        if self._lazy_edges:
+            for idx in range(len(self._edges)):
+                self._edge(idx)
+            self._lazy_edges = False
+
+        return self._edges
+
+    @property
+    def edge_store(self) -> EdgeStore:
+        return self._edge_store
 
     def __getitem__(self, idx: int) -> Node:
         return self._graph[idx]
@@ -342,11 +754,33 @@ class Graph:
 
 
 class CarsFactory:
+    """
+    Every locality draws destinations of its cars from its own random stream,
+    seeded by the seed of the factory and the index of the locality,
+    so the cars of a locality do not depend on the order in which localities are visited
+    or on the other localities simulated in the same process.
+    """
     _graph: Graph
     _popularity_factors: list[tuple[int, float]]
+    _seed: int
+    _generators: dict[int, np.random.Generator]
+    routes: RouteTable
+
+    def __init__(
+        self,
+        graph: Graph,
+        routes: RouteTable | None = None,
+        rng: np.random.Generator | None = None
+    ) -> None:
+        """
+        The seed is drawn from rng, or from the global random state if it is None.
+        """
+        from pathfinder import RouteTable
 
-    def __init__(self, graph: Graph) -> None:
         self._graph = graph
+        self.routes = RouteTable(graph) if routes is None else routes
+        self._seed = int(np.random.randint(1 << 62) if rng is None else rng.integers(1 << 62))
+        self._generators = {}
 
         self._popularity_factors = sorted(
             [
@@ -356,12 +790,19 @@ class CarsFactory:
             ]
         )
 
-    def generate_cars(self, node_idx: int, amount: int) -> Generator[Car, None, None]:
-        from pathfinder import find_path
+    def generate_destinations(self, node_idx: int, amount: int) -> list[tuple[int, int]]:
+        """
+        Destinations of amount cars leaving the node, drawn with a single multinomial sample.
+        Returns pairs (destination idx, number of cars), cars of a pair share one route.
+        """
+        if amount == 0:
+            return []
+
+        generator = self._generators.get(node_idx)
+        if generator is None:
+            generator = self._generators[node_idx] = np.random.default_rng([self._seed, node_idx])
 
         idxs, factors = zip(*self._popularity_factors)
-        
-        for _ in range(amount):
-            chosen_idx = choice(idxs, p=factors)
-            path = find_path(self._graph, node_idx, chosen_idx)
-            yield Car(node_idx, chosen_idx, path)
+        counts = generator.multinomial(amount, factors)
+
+        return [(idx, int(count)) for idx, count in zip(idxs, counts) if count > 0]
@@ -1,201 +1,96 @@
-from json import load
-from time import sleep
+from time import perf_counter
 from datetime import timedelta
 import csv
 import argparse
+import os
+import json
 
-import matplotlib.pyplot as plt
+import numpy as np
 
-from graph import Graph, Locality, CarsFactory, Car, Edge, Junction, Node
-from distributor import get_leaving_citizens_factor, get_leaving_guests_factor
-from pathfinder import find_path
-from visualization import show
-from optimizer import optimize_graph
-from tools import calc_road_time
-from meter import calc_avg_workload
+from distributor import DepartureSchedule
+from simulation import Simulation, load_graph, save_signal_plans, DELTA, MOD
+from parallel import ParallelSimulation
+from profiler import Profiler
+from recorder import StatsRecorder
 
 
-def load_graph() -> Graph:
-    with open('./map.json', 'r', encoding='utf-8') as file:
-        json = load(file)
+FILEPATH = os.path.join('stat', 'hourly_factors_{mode}.csv')
 
-    try:
-        j_nodes = json["nodes"]
-        nodes = [
-            j_node if j_node[0] == "locality"
-            else j_node[:3] + [{int(k): v for k, v in j_node[3].items()}]
-            for j_node in j_nodes
-        ]
-        roads = json["roads"]
-        return Graph(nodes, roads)
-    except KeyError as e:
-        raise KeyError("Incorrect json format") from e
-
-
-graph = load_graph()
-
-cars_factory = CarsFactory(graph)
-
-cars_edges: dict[Edge, list[Car]] = {edge: [] for edge in graph.edges}
-cars_nodes: dict[int, list[Car]] = {idx: [] for idx in range(len(graph.nodes))}
-
-accumulator_leaving_native_cars = 0
-accumulator_leaving_guest_cars = 0
-
-DELTA = timedelta(seconds=3)
-MOD = timedelta(days=1)
-HOUR_BORDER = timedelta(hours=1)
-
-FILEPATH = 'stat\hourly_factors_{mode}.csv'
-
-time = timedelta(days=1) - DELTA
-hourly_stats = []
 
 def save_hourly_factors(factors: list[float], mode: str) -> None:
     if len(factors) != 24:
         raise ValueError("Input list must contain exactly 24 elements (one for each hour).")
-    
+
     # Open file in append mode, creating it if it doesn't exist
-    with open(FILEPATH.format(mode), 'a', newline='') as csvfile:
+    with open(FILEPATH.format(mode=mode), 'a', newline='') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(factors)
 
 
-def check_hour_border() -> bool:
-    global time
-    a = time // HOUR_BORDER
-    b = (time + DELTA) // HOUR_BORDER
-    return a < b
-
-
-def distribute_cars(locality: Locality, cars: list[Car]):
-    for car in cars:
-        if car.cur_path is None or len(car.cur_path) == 0:
-            continue
-
-        nearest_node = car.cur_path[0]
-
-        road = locality.output_roads[nearest_node.idx]
-
-        if road.update_cars((old_amount_cars := road.cars) + 1) == old_amount_cars + 1:
-            if car in cars_nodes[locality.idx]:
-                cars_nodes[locality.idx].remove(car)
-
-            car.previous_node = locality
-            car.cur_edge = road
-            car.time_reaching_node = time + timedelta(seconds=round(calc_road_time(locality, nearest_node)))
-            car.cur_node_idx = None
-
-            cars_edges[road].append(car)
-
-
-def generate_cars():
-    global accumulator_leaving_guest_cars, accumulator_leaving_native_cars, time
-
-    leaving_citizens_factor = get_leaving_citizens_factor(time, DELTA)
-    leaving_guests_factor = get_leaving_guests_factor(time, DELTA)
-
-    for node in graph:
-        if not isinstance(node, Locality):
-            continue
-
-        locality: Locality = node
-
-        all_leaving_native_cars = locality.population * locality.emigration_factor
-        accumulator_leaving_native_cars += all_leaving_native_cars * leaving_citizens_factor
-        cur_leaving_native_cars = int(accumulator_leaving_native_cars)
-        accumulator_leaving_native_cars -= cur_leaving_native_cars
-
-        guest_cars = cars_nodes[locality.idx]
-
-        all_leaving_guest_cars = len(guest_cars)
-        accumulator_leaving_guest_cars += all_leaving_guest_cars * leaving_guests_factor
-        cur_leaving_guest_cars = int(accumulator_leaving_guest_cars)
-        accumulator_leaving_guest_cars -= cur_leaving_guest_cars
-
-        for car in guest_cars[:cur_leaving_guest_cars]:
-            car.cur_path = find_path(graph, car.cur_node_idx, car.from_node_idx)
-
-        leaving_citizens_cars = cars_factory.generate_cars(
-                locality.idx,
-                cur_leaving_native_cars
-            )
-
-        distribute_cars(
-            locality,
-            leaving_citizens_cars
-        )
-
-        distribute_cars(locality, guest_cars[:cur_leaving_guest_cars])
-
-
-def cars_driving():
-    for edge, cars_stream in cars_edges.items():
-        cars_to_remove = []
-        number_passed_cars = 0
-
-        for car in cars_stream:
-            cur_node = car.cur_path[0]
-            if isinstance(cur_node, Junction) and number_passed_cars >= cur_node.bandwidth:
-                break
-
-            if time < car.time_reaching_node:
-                continue
-
-            if len(car.cur_path) == 1:
-                car.cur_path.pop(0)
-                edge.update_cars(edge.cars - 1)
-                cars_to_remove.append(car)
-
-                car.previous_node = None
-                car.cur_edge = None
-                car.cur_node_idx = cur_node.idx
-
-                if cur_node.idx == car.from_node_idx:
-                    del car
-                else:
-                    cars_nodes[cur_node.idx].append(car)
-
-                continue
-
-            next_node: Node = car.cur_path[1]
-
-            if isinstance(cur_node, Junction):
-                if not cur_node.out_stoplight.is_green(time):
-                    continue
-
-                stoplight = cur_node.stoplights.get(next_node.idx)
-
-                if stoplight is not None and not stoplight.is_green(time):
-                    continue
-            
-            number_passed_cars += 1
-            next_road = cur_node.output_roads.get(next_node.idx)
-
-            if next_road.update_cars((next_road_cars := next_road.cars) + 1) > next_road_cars:
-                edge.update_cars(edge.cars - 1)
-                car.cur_edge = next_road
-                car.time_reaching_node = time + timedelta(seconds=round(calc_road_time(cur_node, next_node)))
-                car.previous_node = cur_node
-                car.cur_path.pop(0)
-
-                cars_edges[next_road].append(car)
-                cars_to_remove.append(car)
-
-        for car in cars_to_remove:
-            cars_stream.remove(car)
+def print_throughput(simulated_seconds: float, elapsed: float) -> None:
+    print(f"Simulated {simulated_seconds:.0f} s in {elapsed:.2f} s: "
+          f"{simulated_seconds / elapsed:.1f} simulated seconds per second")
 
 
 def main():
-    global time
-
     # add arguments for file
     parser = argparse.ArgumentParser(description='Analyze and plot hourly average workload')
 
     parser.add_argument('--optimized', action='store_true', help='Turn on optimized mode')
     parser.add_argument('--show-data', action='store_true', help='Show hourly average workload')
     parser.add_argument('--invisible', action='store_true', help='Do not show plot')
+    parser.add_argument('--fps', type=float, default=10.0, help='Maximum frames per second of the plot')
     parser.add_argument('--save', action='store_true', help='Save data to statistics files')
+    parser.add_argument(
+        '--tick-mode', action='store_true',
+        help='Visit every car on every tick instead of waking roads by events (compatibility mode)')
+    parser.add_argument(
+        '--days', type=int, default=None,
+        help='Stop after the given number of simulated days and print the throughput')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Re-plan only junctions whose roads changed their number of cars')
+    parser.add_argument(
+        '--control-interval', type=int, default=0,
+        help='Seconds between runs of the incremental optimizer, e.g. one light cycle')
+    parser.add_argument(
+        '--async-optimizer', action='store_true',
+        help='Plan stoplights of the optimized mode in a background process and print the latency of plans')
+    parser.add_argument(
+        '--congestion-interval', type=int, default=0,
+        help='Seconds between updates of travel times and routes from current traffic, 0 keeps free flow times')
+    parser.add_argument(
+        '--departures', default=None, metavar='PATH',
+        help='Json of hourly departure counts of citizens and guests, also per locality, instead of Gaussian peaks')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of random generators')
+    parser.add_argument('--map', default='./map.json', help='Path to the json or compiled binary map file')
+    parser.add_argument('--save-plans', default=None, help='Save signal plans of junctions to the file at the end')
+    parser.add_argument(
+        '--regions', type=int, default=1,
+        help='Split the map into regions simulated in parallel processes, needs --days and turns off the plot')
+    parser.add_argument(
+        '--profile', nargs='?', const='', default=None, metavar='PATH',
+        help='Print times of tick phases and per-tick counters at the end, or save them as json to the path')
+    parser.add_argument(
+        '--record', default=None, metavar='DIR',
+        help='Stream per-road, per-junction and per-trip statistics into binary files of the directory')
+    parser.add_argument(
+        '--record-interval', type=int, default=300,
+        help='Seconds of simulated time between records of roads and junctions')
+    parser.add_argument(
+        '--export-frames', default=None, metavar='DIR',
+        help='Render PNG frames of road workloads offscreen into the directory')
+    parser.add_argument(
+        '--export-video', default=None, metavar='PATH',
+        help='Render road workloads offscreen into a video, gif or any format of ffmpeg')
+    parser.add_argument(
+        '--export-stride', type=int, default=20, help='Ticks between exported frames')
+    parser.add_argument(
+        '--export-lossless', action='store_true',
+        help='Make the simulation wait for the renderer instead of dropping frames it cannot keep up with')
+    parser.add_argument(
+        '--cprofile', default=None, metavar='PATH',
+        help='Dump cProfile statistics of the run to the path, e.g. for snakeviz or flameprof')
 
     args = parser.parse_args()
 
@@ -206,36 +101,131 @@ def main():
 
     mode = "optimized" if is_optimized else "default"
 
+    hourly_stats = []
+
+    def on_hour(hour: int, avg_workload: float) -> None:
+        if not (show_data or save_data):
+            return
+
+        hourly_stats.append(avg_workload)
+
+        if show_data:
+            print(f"{hour}: {avg_workload}")
+
+        if save_data and len(hourly_stats) == 24:
+            save_hourly_factors(hourly_stats, mode)
+            print("DATA IS SAVED!")
+            hourly_stats.clear()
+
+    if args.async_optimizer and not is_optimized:
+        parser.error("--async-optimizer needs --optimized")
+
+    if args.regions > 1:
+        if args.days is None:
+            parser.error("--regions needs --days")
+        if args.record is not None or args.export_frames is not None or args.export_video is not None:
+            parser.error("--record and exports do not work with --regions")
+        if args.departures is not None:
+            parser.error("--departures does not work with --regions")
+        if args.async_optimizer:
+            parser.error("--async-optimizer does not work with --regions")
+        if args.incremental or args.control_interval != 0:
+            parser.error("--incremental and --control-interval do not work with --regions")
+        if args.save_plans is not None:
+            parser.error("--save-plans does not work with --regions")
+        if args.congestion_interval != 0:
+            parser.error("--congestion-interval does not work with --regions")
+        if args.profile is not None or args.cprofile is not None:
+            parser.error("--profile and --cprofile do not work with --regions")
+
+        parallel_simulation = ParallelSimulation(
+            args.map, args.regions, args.seed, optimized=is_optimized, event_driven=not args.tick_mode)
+
+        started = perf_counter()
+        parallel_simulation.run(days=args.days, on_hour=on_hour)
+        print_throughput(args.days * MOD.total_seconds(), perf_counter() - started)
+        return
+
+    rng = None if args.seed is None else np.random.default_rng(args.seed)
+    simulation = Simulation(
+        load_graph(args.map, rng),
+        optimized=is_optimized,
+        event_driven=not args.tick_mode,
+        rng=rng,
+        incremental=args.incremental,
+        control_interval=timedelta(seconds=args.control_interval),
+        congestion_interval=timedelta(seconds=args.congestion_interval) if args.congestion_interval > 0 else None,
+        departures=None if args.departures is None else DepartureSchedule.from_file(args.departures, DELTA),
+        asynchronous=args.async_optimizer
+    )
+
+    recorder = None
+    if args.record is not None:
+        recorder = StatsRecorder(args.record, simulation.graph, args.record_interval)
+        recorder.attach(simulation)
+
+    exporter = None
+    if args.export_frames is not None or args.export_video is not None:
+        # imported only for exports, like the plotting libraries
+        from export import FrameExporter
+
+        exporter = FrameExporter(
+            simulation.graph, args.export_frames, args.export_video, args.export_stride, lossless=args.export_lossless)
+        exporter.attach(simulation)
+
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler()
+        profiler.attach(simulation)
+
+    on_draw = None
     if visible:
+        # plotting libraries are loaded only when they are needed
+        import matplotlib.pyplot as plt
+        from visualization import Renderer
+
+        renderer = Renderer(args.fps)
+        on_draw = renderer if profiler is None else profiler.timed('draw', renderer)
         plt.ion()
 
-    while True:
-        generate_cars()
+    c_profile = None
+    if args.cprofile is not None:
+        import cProfile
+
+        c_profile = cProfile.Profile()
+        c_profile.enable()
+
+    started = perf_counter()
+    try:
+        simulation.run(days=args.days, on_hour=on_hour, on_draw=on_draw)
+    finally:
+        # an endless run is stopped by the user, the collected profile is still reported
+        elapsed = perf_counter() - started
 
-        if visible:
-            show(graph, time)
+        if recorder is not None:
+            recorder.close()
 
-        cars_driving()
-        if visible:
-            show(graph, time)
+        if exporter is not None:
+            print(f"Exported {exporter.close()} frames, dropped {exporter.dropped}")
 
-        if is_optimized:
-            optimize_graph(graph)
+        if simulation.planner is not None:
+            simulation.planner.close()
+            print(json.dumps(simulation.planner.summary(), indent=4))
 
-        if check_hour_border() and (show_data or save_data):
-            hour = (time + DELTA) % MOD // HOUR_BORDER
-            avg_workload = round(calc_avg_workload(graph) * 1e4, 3)
-            hourly_stats.append(avg_workload)
+        if c_profile is not None:
+            c_profile.disable()
+            c_profile.dump_stats(args.cprofile)
 
-            if show_data:
-                print(f"{hour}: {avg_workload}")
+        if profiler is not None:
+            if args.profile:
+                profiler.save(args.profile)
+            else:
+                print(profiler.format_summary())
 
-            if save_data and len(hourly_stats) == 24:
-                save_hourly_factors(hourly_stats, mode)
-                print("DATA IS SAVED!")
-                hourly_stats.clear()
+    print_throughput(simulation.tick * simulation.delta.total_seconds(), elapsed)
 
-        time = (time + DELTA) % MOD
+    if args.save_plans is not None:
+        save_signal_plans(simulation.graph, args.save_plans)
 
     if visible:
         plt.ioff()
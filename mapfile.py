@@ -0,0 +1,277 @@
+"""
+Compiled binary maps.
+
+A map file is a header followed by raw little-endian 8-byte arrays:
+node attributes, roads in CSR order (sorted by their from nodes) and
+stoplights and dependencies of junctions, also in CSR order by junction.
+Initial lights which follow from dependencies are checked and stored by the compiler,
+the other stoplights get random ones when the map is loaded.
+The loader maps the file into memory, so processes loading the same map share its pages.
+"""
+
+from __future__ import annotations
+import argparse
+import gc
+
+import numpy as np
+
+from graph import EdgeStore, Graph, Junction, Locality, Node
+
+
+MAGIC = b'TLIGRAPH'
+VERSION = 2
+
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<i8'),
+    ('nodes', '<i8'),
+    ('edges', '<i8'),
+    ('stoplights', '<i8'),
+    ('dependencies', '<i8')
+])
+
+LOCALITY = 0
+JUNCTION = 1
+
+RANDOM_LIGHT = -1
+
+
+def _layout(nodes: int, edges: int, stoplights: int, dependencies: int) -> list[tuple[str, str, int]]:
+    """
+    Names, types and lengths of the arrays in the order they are stored.
+    """
+    return [
+        ('kind', '<i8', nodes),
+        ('population', '<f8', nodes),
+        ('emigration_factor', '<f8', nodes),
+        ('popularity_factor', '<f8', nodes),
+        ('bandwidth', '<i8', nodes),
+        ('out_green', '<i8', nodes),
+        ('out_red', '<i8', nodes),
+
+        ('edge_offsets', '<i8', nodes + 1),
+        ('from_idx', '<i8', edges),
+        ('to_idx', '<i8', edges),
+        ('speed_limit', '<f8', edges),
+        ('length', '<f8', edges),
+        ('width', '<f8', edges),
+        ('volume', '<f8', edges),
+
+        ('stoplight_offsets', '<i8', nodes + 1),
+        ('stoplight_node', '<i8', stoplights),
+        ('stoplight_green', '<i8', stoplights),
+        ('stoplight_red', '<i8', stoplights),
+        ('stoplight_initial', '<i8', stoplights),
+
+        ('dependency_offsets', '<i8', nodes + 1),
+        ('dependency_node', '<i8', dependencies),
+        ('dependency_opposite', '<i8', dependencies)
+    ]
+
+
+def _dependent_lights(junction: Junction) -> set[int]:
+    """
+    Stoplights whose initial lights follow from the first stoplight through dependencies,
+    the way Junction sets them.
+    """
+    if not junction.dependencies or not junction.stoplights:
+        return set()
+
+    first_idx = next(iter(junction.stoplights))
+    dependent = {first_idx}
+    stack = [first_idx]
+    while stack:
+        for opposite_idx in junction.dependencies.get(stack.pop(), []):
+            if opposite_idx not in dependent:
+                dependent.add(opposite_idx)
+                stack.append(opposite_idx)
+
+    return dependent
+
+
+def save_binary_map(graph: Graph, filepath: str) -> None:
+    nodes = graph.nodes
+    store = graph.edge_store
+
+    stoplights: list[tuple[int, int, int, int]] = []
+    dependencies: list[tuple[int, int]] = []
+    stoplight_offsets = [0]
+    dependency_offsets = [0]
+
+    for node in nodes:
+        if isinstance(node, Junction):
+            dependent = _dependent_lights(node)
+            stoplights.extend(
+                (
+                    node_idx, stoplight.green, stoplight.red,
+                    int(stoplight.initial_light) if node_idx in dependent else RANDOM_LIGHT
+                )
+                for node_idx, stoplight in node.stoplights.items()
+            )
+            dependencies.extend(
+                (node_idx, opposite_idx)
+                for node_idx, opposite_idxs in (node.dependencies or {}).items()
+                for opposite_idx in opposite_idxs
+            )
+
+        stoplight_offsets.append(len(stoplights))
+        dependency_offsets.append(len(dependencies))
+
+    layout = _layout(len(nodes), len(store), len(stoplights), len(dependencies))
+    arrays = {name: np.zeros(length, dtype=dtype) for name, dtype, length in layout}
+
+    for node in nodes:
+        if isinstance(node, Locality):
+            arrays['kind'][node.idx] = LOCALITY
+            arrays['population'][node.idx] = node.population
+            arrays['emigration_factor'][node.idx] = node.emigration_factor
+            arrays['popularity_factor'][node.idx] = node.popularity_factor
+        else:
+            arrays['kind'][node.idx] = JUNCTION
+            arrays['bandwidth'][node.idx] = node.bandwidth
+            arrays['out_green'][node.idx] = node.out_stoplight.green
+            arrays['out_red'][node.idx] = node.out_stoplight.red
+
+    arrays['stoplight_offsets'][:] = stoplight_offsets
+    arrays['dependency_offsets'][:] = dependency_offsets
+
+    arrays['edge_offsets'][1:] = np.cumsum(np.bincount(store.from_idx[:len(store)], minlength=len(nodes)))
+    for name in ('from_idx', 'to_idx', 'speed_limit', 'length', 'width', 'volume'):
+        arrays[name][:] = getattr(store, name)[:len(store)]
+
+    if stoplights:
+        (
+            arrays['stoplight_node'][:], arrays['stoplight_green'][:],
+            arrays['stoplight_red'][:], arrays['stoplight_initial'][:]
+        ) = zip(*stoplights)
+    if dependencies:
+        arrays['dependency_node'][:], arrays['dependency_opposite'][:] = zip(*dependencies)
+
+    header = np.array(
+        [(MAGIC, VERSION, len(nodes), len(store), len(stoplights), len(dependencies))], dtype=HEADER)
+
+    with open(filepath, 'wb') as file:
+        file.write(header.tobytes())
+        for name, _, _ in layout:
+            file.write(arrays[name].tobytes())
+
+
+def is_binary_map(filepath: str) -> bool:
+    with open(filepath, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def _build_nodes(arrays: dict[str, np.ndarray], rng: np.random.Generator | None) -> list[Node]:
+    kinds = arrays['kind'].tolist()
+    population = arrays['population'].tolist()
+    emigration_factor = arrays['emigration_factor'].tolist()
+    popularity_factor = arrays['popularity_factor'].tolist()
+    bandwidth = arrays['bandwidth'].tolist()
+    out_green = arrays['out_green'].tolist()
+    out_red = arrays['out_red'].tolist()
+
+    stoplight_offsets = arrays['stoplight_offsets'].tolist()
+    stoplights = list(zip(
+        arrays['stoplight_node'].tolist(), arrays['stoplight_green'].tolist(),
+        arrays['stoplight_red'].tolist(), arrays['stoplight_initial'].tolist()
+    ))
+
+    # dependencies of a stoplight are stored next to each other, so they are cut into groups of stoplights
+    dependency_node = arrays['dependency_node']
+    cuts = np.ones(len(dependency_node), dtype=np.bool_)
+    cuts[1:] = dependency_node[1:] != dependency_node[:-1]
+    cuts[arrays['dependency_offsets'][:-1][arrays['dependency_offsets'][:-1] < len(cuts)]] = True
+
+    group_starts = np.flatnonzero(cuts)
+    group_offsets = np.searchsorted(group_starts, arrays['dependency_offsets']).tolist()
+    group_nodes = dependency_node[group_starts].tolist()
+    group_bounds = np.append(group_starts, len(dependency_node)).tolist()
+    opposites = arrays['dependency_opposite'].tolist()
+
+    nodes: list[Node] = []
+    for idx, kind in enumerate(kinds):
+        if kind == LOCALITY:
+            nodes.append(Locality(idx, population[idx], emigration_factor[idx], popularity_factor[idx]))
+            continue
+
+        node_dependencies = {
+            group_nodes[group]: opposites[group_bounds[group]:group_bounds[group + 1]]
+            for group in range(group_offsets[idx], group_offsets[idx + 1])
+        }
+
+        node_stoplights = stoplights[stoplight_offsets[idx]:stoplight_offsets[idx + 1]]
+        nodes.append(Junction(
+            idx,
+            bandwidth[idx],
+            (out_green[idx], out_red[idx]),
+            {node_idx: (green, red) for node_idx, green, red, _ in node_stoplights},
+            node_dependencies,
+            rng=rng,
+            initial_lights={
+                node_idx: initial == 1 for node_idx, _, _, initial in node_stoplights if initial != RANDOM_LIGHT
+            }
+        ))
+
+    return nodes
+
+
+def load_binary_map(filepath: str, rng: np.random.Generator | None = None) -> Graph:
+    """
+    Arrays of roads are used straight from the mapped file, only node objects are built.
+    Stored initial lights are not checked against dependencies again.
+    """
+    buffer = np.memmap(filepath, dtype=np.uint8, mode='r')
+    header = buffer[:HEADER.itemsize].view(HEADER)[0]
+
+    if header['magic'] != MAGIC or header['version'] != VERSION:
+        raise ValueError("Incorrect binary map format, the map may need to be compiled again")
+
+    arrays = {}
+    offset = HEADER.itemsize
+    for name, dtype, length in _layout(
+            int(header['nodes']), int(header['edges']), int(header['stoplights']), int(header['dependencies'])):
+        size = length * np.dtype(dtype).itemsize
+        arrays[name] = buffer[offset:offset + size].view(dtype)
+        offset += size
+
+    # only new objects are created, so collections of the garbage collector would scan them for nothing
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        nodes = _build_nodes(arrays, rng)
+    finally:
+        if collecting:
+            gc.enable()
+
+    store = EdgeStore.from_arrays(
+        arrays['from_idx'],
+        arrays['to_idx'],
+        arrays['speed_limit'],
+        arrays['length'],
+        arrays['width'],
+        arrays['volume']
+    )
+    return Graph.from_store(nodes, store)
+
+
+def compile_map(json_path: str, binary_path: str) -> None:
+    # the json loader lives in simulation, which also reads binary maps
+    from simulation import load_graph
+
+    save_binary_map(load_graph(json_path), binary_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a json map into the binary map format')
+
+    parser.add_argument('json_path', help='Path to the json map')
+    parser.add_argument('binary_path', help='Path to the compiled map')
+
+    args = parser.parse_args()
+
+    compile_map(args.json_path, args.binary_path)
+    print(f"Map {args.json_path} is compiled to {args.binary_path}")
+
+
+if __name__ == "__main__":
+    main()
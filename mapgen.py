@@ -0,0 +1,215 @@
+"""
+Synthetic city maps for benchmarks.
+
+Junctions are laid out as a grid, as rings around a center (radial) or as a jittered grid
+with random streets removed and diagonals added (random planar), and localities are attached
+to some of them. Roads are two-way. Input stoplights of a junction are split into two streams
+by the direction of their roads relative to the axis of the junction, every light of one stream
+depends on every light of the other one, and the streams get complementary times of the same cycle,
+so dependent lights are compatible and the phase table of a junction is one cycle long.
+"""
+
+from math import atan2, cos, hypot, pi, sin, sqrt
+import argparse
+import json
+
+import numpy as np
+
+
+KINDS = ('grid', 'radial', 'planar')
+
+CYCLES = (40, 50, 60, 70)
+MIN_GREEN = 15
+
+# length of a street between neighbouring junctions of the layouts and of a locality access road
+BLOCK_LENGTH = 400
+ACCESS_LENGTH = 250
+
+
+def _grid_layout(junctions: int, rng: np.random.Generator) -> tuple[list[tuple[float, float]], set[tuple[int, int]]]:
+    rows = max(1, round(sqrt(junctions)))
+    cols = max(1, round(junctions / rows))
+
+    points = [(col, row) for row in range(rows) for col in range(cols)]
+    streets = set()
+    for row in range(rows):
+        for col in range(cols):
+            idx = row * cols + col
+            if col + 1 < cols:
+                streets.add((idx, idx + 1))
+            if row + 1 < rows:
+                streets.add((idx, idx + cols))
+
+    return points, streets
+
+
+def _radial_layout(junctions: int, rng: np.random.Generator) -> tuple[list[tuple[float, float]], set[tuple[int, int]]]:
+    rings = max(1, round(sqrt(junctions / 6)))
+    spokes = max(3, round((junctions - 1) / rings))
+
+    points = [(0.0, 0.0)]
+    streets = set()
+    for ring in range(rings):
+        for spoke in range(spokes):
+            angle = 2 * pi * spoke / spokes
+            points.append(((ring + 1) * cos(angle), (ring + 1) * sin(angle)))
+
+            idx = 1 + ring * spokes + spoke
+            streets.add((0 if ring == 0 else idx - spokes, idx))
+            streets.add((idx, 1 + ring * spokes + (spoke + 1) % spokes))
+
+    return points, streets
+
+
+def _planar_layout(junctions: int, rng: np.random.Generator) -> tuple[list[tuple[float, float]], set[tuple[int, int]]]:
+    """
+    Streets of a random spanning tree of the grid are kept, other grid streets are kept with
+    a probability, and a cell gets at most one diagonal, so streets never cross.
+    """
+    grid_points, grid_streets = _grid_layout(junctions, rng)
+    cols = max(x for x, _ in grid_points) + 1
+    rows = max(y for _, y in grid_points) + 1
+
+    jitter = rng.uniform(-0.3, 0.3, size=(len(grid_points), 2))
+    points = [(x + dx, y + dy) for (x, y), (dx, dy) in zip(grid_points, jitter.tolist())]
+
+    # Kruskal over random weights gives a random spanning tree
+    parents = list(range(len(points)))
+
+    def find(idx: int) -> int:
+        while parents[idx] != idx:
+            parents[idx] = parents[parents[idx]]
+            idx = parents[idx]
+        return idx
+
+    streets = set()
+    ordered = sorted(grid_streets)
+    for position in rng.permutation(len(ordered)).tolist():
+        a, b = ordered[position]
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parents[root_a] = root_b
+            streets.add((a, b))
+        elif rng.random() < 0.6:
+            streets.add((a, b))
+
+    for row in range(rows - 1):
+        for col in range(cols - 1):
+            if rng.random() < 0.3:
+                idx = row * cols + col
+                streets.add((idx, idx + cols + 1) if rng.random() < 0.5 else (idx + 1, idx + cols))
+
+    return points, streets
+
+
+LAYOUTS = {'grid': _grid_layout, 'radial': _radial_layout, 'planar': _planar_layout}
+
+
+def generate_map(kind: str = 'grid', nodes: int = 1000, seed: int = 0) -> dict:
+    """
+    Map in the json format of map.json with about the given number of nodes,
+    about sqrt(nodes) of them are localities.
+    """
+    if kind not in LAYOUTS:
+        raise ValueError(f"Unknown map kind {kind}, expected one of {', '.join(KINDS)}")
+
+    rng = np.random.default_rng(seed)
+
+    localities = max(2, round(sqrt(nodes)))
+    points, streets = LAYOUTS[kind](max(1, nodes - localities), rng)
+    junctions = len(points)
+    localities = min(localities, junctions)
+
+    # a radial junction is aligned with its spoke, the others with the x axis
+    axes = [atan2(y, x) if kind == 'radial' else 0.0 for x, y in points]
+
+    neighbours: list[list[int]] = [[] for _ in points]
+    for a, b in streets:
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    hosts = sorted(rng.choice(junctions, size=localities, replace=False).tolist())
+    for locality_idx, host_idx in enumerate(hosts, junctions):
+        # an access road comes at 30 degrees to the axis of its junction
+        angle = axes[host_idx] + pi / 6
+        x, y = points[host_idx]
+        points.append((x + 0.3 * cos(angle), y + 0.3 * sin(angle)))
+        neighbours[host_idx].append(locality_idx)
+        neighbours.append([host_idx])
+
+    cycles = rng.choice(CYCLES, size=junctions)
+    greens = rng.integers(MIN_GREEN, cycles - MIN_GREEN + 1).tolist()
+    bandwidths = rng.integers(4, 7, size=junctions).tolist()
+    cycles = cycles.tolist()
+
+    map_nodes = []
+    for idx in range(junctions):
+        cycle = cycles[idx]
+        green = greens[idx]
+
+        x, y = points[idx]
+        streams: tuple[list[int], list[int]] = ([], [])
+        for adj_idx in sorted(neighbours[idx]):
+            adj_x, adj_y = points[adj_idx]
+            angle = (atan2(adj_y - y, adj_x - x) - axes[idx]) % pi
+            streams[pi / 4 <= angle < 3 * pi / 4].append(adj_idx)
+
+        stoplights = {str(adj_idx): [green, cycle - green] for adj_idx in streams[0]}
+        stoplights.update({str(adj_idx): [cycle - green, green] for adj_idx in streams[1]})
+
+        node = ["junction", bandwidths[idx], [green, cycle - green], stoplights]
+        if streams[0] and streams[1]:
+            dependencies = {str(adj_idx): streams[1] for adj_idx in streams[0]}
+            dependencies.update({str(adj_idx): streams[0] for adj_idx in streams[1]})
+            node.append(dependencies)
+
+        map_nodes.append(node)
+
+    # popularity factors are probabilities of destinations, so they sum up to one
+    popularity = rng.uniform(0.5, 1.5, size=len(hosts))
+    for popularity_factor in (popularity / popularity.sum()).tolist():
+        map_nodes.append([
+            "locality",
+            int(rng.integers(2000, 15001)),
+            round(float(rng.uniform(0.3, 0.7)), 2),
+            popularity_factor
+        ])
+
+    ends = [(idx, adj_idx) for idx, adjacent in enumerate(neighbours) for adj_idx in adjacent]
+    speed_limits = rng.choice((40, 50, 60, 70), size=len(ends)).tolist()
+    widths = rng.choice((2.5, 3.0, 3.5, 4.0), size=len(ends)).tolist()
+
+    roads = []
+    for (idx, adj_idx), speed_limit, width in zip(ends, speed_limits, widths):
+        x, y = points[idx]
+        adj_x, adj_y = points[adj_idx]
+        is_access = idx >= junctions or adj_idx >= junctions
+        length = ACCESS_LENGTH if is_access else round(BLOCK_LENGTH * hypot(adj_x - x, adj_y - y), 1)
+
+        roads.append([idx, adj_idx, speed_limit, max(length, 50.0), width])
+
+    return {"nodes": map_nodes, "roads": roads}
+
+
+def save_map(city: dict, filepath: str) -> None:
+    with open(filepath, 'w', encoding='utf-8') as file:
+        json.dump(city, file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic city map in the json map format')
+
+    parser.add_argument('path', help='Path to the generated map')
+    parser.add_argument('--kind', choices=KINDS, default='grid', help='Layout of junctions')
+    parser.add_argument('--nodes', type=int, default=1000, help='Approximate number of nodes')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generator')
+
+    args = parser.parse_args()
+
+    city = generate_map(args.kind, args.nodes, args.seed)
+    save_map(city, args.path)
+    print(f"Map with {len(city['nodes'])} nodes and {len(city['roads'])} roads is saved to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
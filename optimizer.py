@@ -1,13 +1,15 @@
 from graph import Graph, Locality, Node, Junction, StopLight
 import math
 from collections import deque
-from collections.abc import MutableSequence
+from collections.abc import Callable, Iterable, MutableSequence
+from datetime import timedelta
 
 
-def optimize_graph(graph: Graph) -> None:
+def reachable_junctions(graph: Graph) -> list[Junction]:
     '''
-    Function optimizes stoplights time-intervals based on road traffic
+    Junctions in the order of BFS from all localities
     '''
+    junctions = []
     visited = set()
     queue: MutableSequence[Node] = deque()
 
@@ -24,22 +26,35 @@ def optimize_graph(graph: Graph) -> None:
                 visited.add(adj_idx)
                 queue.append(graph[adj_idx])
 
-        if isinstance(current_node, Locality):
-            continue
+        if not isinstance(current_node, Locality):
+            junctions.append(current_node)
+
+    return junctions
 
-        current_node: Junction = current_node
 
-        weights = {}
-        total_weight = 0
+def optimize_graph(graph: Graph, junctions: Iterable[Junction] | None = None) -> list[Junction]:
+    '''
+    Function optimizes stoplights time-intervals based on road traffic.
+    Only the given junctions are optimized, all reachable ones if junctions is None.
+    Returns junctions whose stoplights got new times.
+    '''
+    if junctions is None:
+        junctions = reachable_junctions(graph)
 
-        for node_idx, road in current_node.output_roads.items():
-            weight = road.workload
-            weights[node_idx] = weight
-            total_weight += weight
+    updated = []
 
-        if not weights or total_weight == 0:
+    workloads = graph.edge_store.workloads()
+    total_weights = graph.edge_store.nodes_workloads(len(graph.nodes))
+
+    for current_node in junctions:
+        if total_weights[current_node.idx] == 0:
             continue
 
+        weights = {
+            node_idx: workloads[road.idx]
+            for node_idx, road in current_node.output_roads.items()
+        }
+
         stoplights = current_node.stoplights
         if not stoplights:
             continue
@@ -48,7 +63,7 @@ def optimize_graph(graph: Graph) -> None:
             if node_idx not in weights:
                 continue
 
-            current_cycle = stoplight.green_time.seconds + stoplight.red_time.seconds
+            current_cycle = stoplight.green + stoplight.red
             if len(weights) == 1:
                 g_new = current_cycle
             else:
@@ -58,10 +73,13 @@ def optimize_graph(graph: Graph) -> None:
 
             ideal_red = current_cycle - g_new
 
-            r_new = find_non_overlapping_red_time(stoplight, g_new, ideal_red)
+            def fits(green: int, red: int) -> bool:
+                return current_node.incompatible_dependency(node_idx, green, red) is None
+
+            r_new = find_non_overlapping_red_time(stoplight, g_new, ideal_red, fits)
             if r_new is None:
                 for g_new_tmp in range(g_new // 5, 0, -1):
-                    r_new = find_non_overlapping_red_time(stoplight, g_new_tmp, ideal_red)
+                    r_new = find_non_overlapping_red_time(stoplight, g_new_tmp, ideal_red, fits)
 
                     if r_new is not None:
                         g_new = g_new_tmp
@@ -69,21 +87,70 @@ def optimize_graph(graph: Graph) -> None:
 
             if r_new:
                 current_node.update_stoplight_times(
-                    stoplight.time_last_update,
+                    stoplight.last_update,
                     g_new,
                     r_new,
                     node_idx
                 )
 
+                if not updated or updated[-1] is not current_node:
+                    updated.append(current_node)
 
-def find_non_overlapping_red_time(stoplight: StopLight, g_new: int, ideal_red: int) -> int | None:
+    return updated
+
+
+class IncrementalOptimizer:
+    '''
+    Re-plans only junctions whose output roads changed their number of cars since the previous run,
+    at most once per control interval.
+    '''
+    _graph: Graph
+    _junctions: set[int]
+    interval: int
+    _last_run: int | None
+
+    def __init__(self, graph: Graph, interval: timedelta = timedelta()) -> None:
+        self._graph = graph
+        self._junctions = {junction.idx for junction in reachable_junctions(graph)}
+        self.interval = interval // timedelta(seconds=1)
+        self._last_run = None
+
+        graph.edge_store.changed[:] = True
+
+    def optimize(self, elapsed: int) -> list[Junction]:
+        '''
+        elapsed is the simulated time in seconds since the start, it is used to keep the control interval.
+        '''
+        if self._last_run is not None and elapsed - self._last_run < self.interval:
+            return []
+
+        self._last_run = elapsed
+
+        dirty_junctions = [
+            self._graph[idx]
+            for idx in self._graph.edge_store.pop_changed_nodes()
+            if idx in self._junctions
+        ]
+        return optimize_graph(self._graph, dirty_junctions)
+
+
+def find_non_overlapping_red_time(
+    stoplight: StopLight,
+    g_new: int,
+    ideal_red: int,
+    fits: Callable[[int, int], bool] | None = None
+) -> int | None:
+    '''
+    Red time closest to the ideal one which keeps the light compatible with its current times.
+    fits is an additional condition on (green, red), e.g. compatibility with dependent stoplights.
+    '''
     min_red = ideal_red * 0.85
     max_red = ideal_red * 1.15
 
     temp_stoplight = StopLight(g_new, ideal_red)
     temp_stoplight.initial_light = stoplight.initial_light
 
-    if temp_stoplight.is_compatible(stoplight):
+    if temp_stoplight.is_compatible(stoplight) and (fits is None or fits(g_new, ideal_red)):
         return ideal_red
 
     best_red = None
@@ -93,7 +160,7 @@ def find_non_overlapping_red_time(stoplight: StopLight, g_new: int, ideal_red: i
         temp_stoplight = StopLight(g_new, red)
         temp_stoplight.initial_light = stoplight.initial_light
 
-        if temp_stoplight.is_compatible(stoplight):
+        if temp_stoplight.is_compatible(stoplight) and (fits is None or fits(g_new, red)):
             diff = abs(red - ideal_red)
 
             if diff < min_diff:
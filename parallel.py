@@ -0,0 +1,263 @@
+from datetime import timedelta
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from typing import Callable, Iterable
+
+import numpy as np
+
+from demand import Demand
+from graph import Graph, Edge, Junction
+from optimizer import optimize_graph, reachable_junctions
+from partition import partition_graph
+from simulation import Simulation, load_graph, DELTA, MOD
+
+
+# (edge idx, lane, origin, destination, path, position, arrival, departure) of a car crossing a border
+CarMessage = tuple[int, int, int, int, tuple[int, ...], int, int, int]
+# cars sent from one region to another and numbers of cars (edge idx, cars) of roads between them
+Parcel = tuple[list[CarMessage], list[tuple[int, int]]]
+
+
+class RegionSimulation(Simulation):
+    """
+    Part of the graph simulated in its own process.
+    A region owns its nodes and the roads leading to them: it drives and counts cars on these roads
+    and generates cars of its localities.
+    Cars entering a road of another region are sent there at the end of the tick.
+    Roads leading to other regions keep a mirror of their number of cars, which is the number
+    reported by the owner on the previous tick plus the cars sent there since then.
+    The owner only removes cars from such a road, so the mirror never lets the road overflow.
+    """
+    region: int
+    regions: list[int]
+
+    _owned_edges: np.ndarray
+    _reported_edges: dict[int, list[int]]
+    _junctions: list[Junction]
+    _outbox: dict[int, list[CarMessage]]
+    _sent: dict[int, int]
+
+    def __init__(
+        self,
+        graph: Graph,
+        regions: list[int],
+        region: int,
+        optimized: bool = False,
+        event_driven: bool = True,
+        delta: timedelta = DELTA,
+        rng: np.random.Generator | None = None
+    ) -> None:
+        """
+        regions[i] is the region of the i-th node.
+        """
+        super().__init__(graph, optimized, event_driven, delta, rng)
+        self.region = region
+        self.regions = regions
+
+        self.cars_edges = {
+            edge: queue for edge, queue in self.cars_edges.items()
+            if regions[edge.to_idx] == region
+        }
+        self.localities = [locality for locality in self.localities if regions[locality.idx] == region]
+        self.demand = Demand(self.localities, self.departures)
+
+        self._owned_edges = np.array(sorted(edge.idx for edge in self.cars_edges), dtype=np.int64)
+        self._reported_edges = {}
+        for edge in self.cars_edges:
+            if regions[edge.from_idx] != region:
+                self._reported_edges.setdefault(regions[edge.from_idx], []).append(edge.idx)
+
+        self._junctions = [junction for junction in reachable_junctions(graph) if regions[junction.idx] == region]
+        self._outbox = {}
+        self._sent = {}
+
+    def _enter(self, road: Edge, cars: Iterable[int], lane: int, arrival: int) -> None:
+        to_region = self.regions[road.to_idx]
+        if to_region == self.region:
+            super()._enter(road, cars, lane, arrival)
+            return
+
+        pool = self.cars
+        outbox = self._outbox.setdefault(to_region, [])
+        sent = 0
+        for car in cars:
+            outbox.append((
+                road.idx, lane, pool.origin[car], pool.destination[car],
+                self.routes.path(pool.route[car]), pool.position[car], arrival, pool.departure[car]
+            ))
+            pool.release(car)
+            sent += 1
+
+        self._sent[road.idx] = self._sent.get(road.idx, 0) + sent
+
+    def pop_parcels(self) -> dict[int, Parcel]:
+        """
+        Parcels for other regions keyed by their region, must be called at the end of a tick.
+        """
+        cars = self.graph.edge_store.cars
+
+        parcels: dict[int, Parcel] = {
+            region: ([], [(edge_idx, int(cars[edge_idx])) for edge_idx in edges])
+            for region, edges in self._reported_edges.items()
+        }
+        for region, messages in self._outbox.items():
+            parcels.setdefault(region, ([], []))[0].extend(messages)
+
+        self._outbox = {}
+        return parcels
+
+    def receive(self, parcels: Iterable[Parcel]) -> None:
+        """
+        Takes cars and numbers of cars sent by other regions on the previous tick.
+        """
+        parcels = list(parcels)
+        store = self.graph.edge_store
+
+        for _, counts in parcels:
+            for edge_idx, count in counts:
+                store.cars[edge_idx] = count + self._sent.get(edge_idx, 0)
+        self._sent.clear()
+
+        pool = self.cars
+        step = self.delta_seconds
+        for messages, _ in parcels:
+            for edge_idx, lane, origin, destination, path, position, arrival, departure in messages:
+                road = self.graph.edges[edge_idx]
+                car = pool.add(origin, destination, self.routes.intern_path(path), arrival, departure)
+                pool.position[car] = position
+
+                road.update_cars(road.cars + 1)
+                queue = self.cars_edges[road]
+                arrival = self._lane_arrival(queue, lane, (car,), arrival)
+                queue.append(car, lane)
+
+                if self.events is not None:
+                    # cars sent on the previous tick can reach the end of the road already on this one
+                    self.events.push(self.tick + max(0, -((self.now - arrival) // step)), edge_idx)
+
+    def measure_workload(self) -> float:
+        """
+        Share of the region in the average workload of the graph.
+        """
+        store = self.graph.edge_store
+        return float(store.workloads()[self._owned_edges].sum() / len(store))
+
+    def optimize(self) -> None:
+        self._wake_junctions(optimize_graph(self.graph, self._junctions))
+
+
+def _simulate_region(
+    connection: Connection,
+    map_path: str,
+    seed: int,
+    regions: list[int],
+    region: int,
+    optimized: bool,
+    event_driven: bool,
+    delta: timedelta,
+    ticks: int
+) -> None:
+    # every region builds the same graph and cars factory as a single process with the seed,
+    # so initial lights and random streams of localities match in all of them
+    rng = np.random.default_rng(seed)
+    simulation = RegionSimulation(
+        load_graph(map_path, rng),
+        regions,
+        region,
+        optimized=optimized,
+        event_driven=event_driven,
+        delta=delta,
+        rng=rng
+    )
+
+    for _ in range(ticks):
+        hourly_workload = simulation.step()
+        share = None if hourly_workload is None else (hourly_workload[0], simulation.measure_workload())
+
+        connection.send((share, simulation.pop_parcels()))
+        simulation.receive(connection.recv())
+
+    connection.close()
+
+
+class ParallelSimulation:
+    """
+    Graph split into regions by partition_graph, every region is simulated in its own process.
+    At the end of every tick regions send cars crossing their borders and numbers of cars
+    of their border roads through the coordinator, which also sums up hourly workloads.
+    """
+    map_path: str
+    seed: int
+    regions: list[int]
+    optimized: bool
+    event_driven: bool
+    delta: timedelta
+
+    def __init__(
+        self,
+        map_path: str = './map.json',
+        regions: int = 2,
+        seed: int | None = None,
+        optimized: bool = False,
+        event_driven: bool = True,
+        delta: timedelta = DELTA
+    ) -> None:
+        self.map_path = map_path
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.regions = partition_graph(load_graph(map_path, np.random.default_rng(self.seed)), regions)
+        self.optimized = optimized
+        self.event_driven = event_driven
+        self.delta = delta
+
+    @property
+    def regions_count(self) -> int:
+        return max(self.regions) + 1
+
+    def run(self, days: int = 1, on_hour: Callable[[int, float], None] | None = None) -> list[float]:
+        """
+        Simulates the given number of days from the start.
+        Returns average workloads of every simulated hour.
+        """
+        ticks = days * (MOD // self.delta)
+
+        connections = []
+        processes = []
+        for region in range(self.regions_count):
+            connection, worker_connection = Pipe()
+            process = Process(
+                target=_simulate_region,
+                args=(worker_connection, self.map_path, self.seed, self.regions, region,
+                      self.optimized, self.event_driven, self.delta, ticks)
+            )
+            process.start()
+
+            connections.append(connection)
+            processes.append(process)
+
+        hourly_workloads = []
+        for _ in range(ticks):
+            inboxes: list[list[Parcel]] = [[] for _ in connections]
+            hour = None
+            workload = 0.0
+
+            for connection in connections:
+                share, parcels = connection.recv()
+                if share is not None:
+                    hour = share[0]
+                    workload += share[1]
+
+                for region, parcel in parcels.items():
+                    inboxes[region].append(parcel)
+
+            for connection, inbox in zip(connections, inboxes):
+                connection.send(inbox)
+
+            if hour is not None:
+                hourly_workloads.append(round(workload * 1e4, 3))
+                if on_hour is not None:
+                    on_hour(hour, hourly_workloads[-1])
+
+        for process in processes:
+            process.join()
+
+        return hourly_workloads
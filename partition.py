@@ -0,0 +1,42 @@
+from collections import deque
+
+from graph import Graph
+
+
+def partition_graph(graph: Graph, regions: int) -> list[int]:
+    '''
+    Splits nodes of the graph into regions of equal size.
+    Nodes are ordered by BFS over roads in both directions, so neighbours get close positions,
+    and the order is cut into contiguous chunks.
+    Returns the region of every node.
+    '''
+    neighbours: list[set[int]] = [set() for _ in graph.nodes]
+    for edge in graph.edges:
+        neighbours[edge.from_idx].add(edge.to_idx)
+        neighbours[edge.to_idx].add(edge.from_idx)
+
+    order = []
+    visited = [False] * len(graph.nodes)
+
+    for start_idx in range(len(graph.nodes)):
+        if visited[start_idx]:
+            continue
+
+        visited[start_idx] = True
+        queue = deque([start_idx])
+
+        while queue:
+            node_idx = queue.popleft()
+            order.append(node_idx)
+
+            for adj_idx in sorted(neighbours[node_idx]):
+                if not visited[adj_idx]:
+                    visited[adj_idx] = True
+                    queue.append(adj_idx)
+
+    regions = max(1, min(regions, len(order)))
+    assignment = [0] * len(order)
+    for position, node_idx in enumerate(order):
+        assignment[node_idx] = position * regions // len(order)
+
+    return assignment
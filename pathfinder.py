@@ -1,17 +1,396 @@
-from typing import Iterable
-import astar
-from tools import calc_road_time
-from graph import Graph, Node
+from heapq import heappush, heappop
+from math import inf
 
+import numpy as np
 
-def find_path(graph: Graph, start_idx: int, goal_idx: int) -> Iterable[Node]:
-    def get_neighbors(node: Node) -> Iterable[Node]:
-        return [graph[idx] for idx in node.output_roads.keys()]
+from tools import calc_roads_times
+from graph import Graph, Node, Locality
 
-    start, goal = graph[start_idx], graph[goal_idx]
 
-    return list(astar.find_path(
-        start, goal,
-        neighbors_fnct=get_neighbors,
-        distance_between_fnct=calc_road_time)
-    )[1:]
+LANDMARKS = 4
+
+
+class RoadNetwork:
+    """
+    Roads of the graph in CSR form: roads leaving node i are offsets[i]:offsets[i + 1]
+    of targets (their end nodes) and weights (their travel times).
+    """
+    offsets: list[int]
+    targets: list[int]
+    weights: list[float]
+
+    def __init__(self, offsets: list[int], targets: list[int], weights: list[float]) -> None:
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @classmethod
+    def from_graph(cls, graph: Graph, reverse: bool = False) -> "RoadNetwork":
+        """
+        Roads of the reversed network lead from their end nodes to their start nodes.
+        """
+        store = graph.edge_store
+        from_idx = store.from_idx[:len(store)]
+        to_idx = store.to_idx[:len(store)]
+        weights = calc_roads_times(store)
+
+        if reverse:
+            order = np.argsort(to_idx, kind="stable")
+            from_idx, to_idx, weights = to_idx[order], from_idx[order], weights[order]
+
+        offsets = np.zeros(len(graph.nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(from_idx, minlength=len(graph.nodes)), out=offsets[1:])
+
+        return cls(offsets.tolist(), to_idx.tolist(), weights.tolist())
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class PathFinder:
+    """
+    Dijkstra and A* searches over RoadNetwork.
+    A* uses the ALT heuristic: distances from and to a few landmarks give lower bounds
+    of distances between any nodes by the triangle inequality.
+    Buffers of the search are allocated once and reused, entries of previous searches
+    are told apart by the stamp of the search.
+    Landmark bounds are computed for the initial weights, they stay admissible
+    as long as weights do not go below them.
+    """
+    network: RoadNetwork
+    _from_landmarks: np.ndarray
+    _to_landmarks: np.ndarray
+
+    _dist: list[float]
+    _prev: list[int]
+    _seen: list[int]
+    _done: list[int]
+    _heap: list[tuple[float, int]]
+    _stamp: int
+    searches: int
+
+    def __init__(self, graph: Graph, landmarks: int = LANDMARKS) -> None:
+        self.network = RoadNetwork.from_graph(graph)
+
+        size = len(self.network)
+        self._dist = [inf] * size
+        self._prev = [-1] * size
+        self._seen = [0] * size
+        self._done = [0] * size
+        self._heap = []
+        self._stamp = 0
+        self.searches = 0
+
+        self._select_landmarks(graph, min(landmarks, size))
+
+    def _select_landmarks(self, graph: Graph, landmarks: int) -> None:
+        """
+        Landmarks are chosen one by one as the node farthest from the chosen ones.
+        """
+        reversed_network = RoadNetwork.from_graph(graph, reverse=True)
+        from_landmarks = []
+        to_landmarks = []
+
+        landmark = 0
+        closest = np.full(len(self.network), inf)
+        for _ in range(landmarks):
+            from_landmarks.append(self.distances_from(landmark))
+            to_landmarks.append(self._distances(reversed_network, landmark))
+
+            np.minimum(closest, from_landmarks[-1], out=closest)
+            reachable = np.isfinite(closest)
+            if not reachable.any():
+                break
+            landmark = int(np.argmax(np.where(reachable, closest, -1)))
+
+        self._from_landmarks = np.array(from_landmarks).reshape(-1, len(self.network))
+        self._to_landmarks = np.array(to_landmarks).reshape(-1, len(self.network))
+
+    def _heuristic(self, goal_idx: int) -> list[float]:
+        """
+        Lower bounds of distances from every node to the goal, inf if the goal is unreachable.
+        """
+        if len(self._from_landmarks) == 0:
+            return [0.0] * len(self.network)
+
+        with np.errstate(invalid="ignore"):
+            bounds = np.maximum(
+                self._from_landmarks[:, goal_idx, None] - self._from_landmarks,
+                self._to_landmarks - self._to_landmarks[:, goal_idx, None]
+            )
+        # inf - inf means the landmark knows nothing about the pair
+        bounds = np.nan_to_num(bounds, nan=0.0, posinf=inf, neginf=0.0)
+
+        return np.maximum(bounds.max(axis=0), 0.0).tolist()
+
+    def _search(
+        self,
+        network: RoadNetwork,
+        start_idx: int,
+        goal_idx: int | None = None,
+        heuristic: list[float] | None = None
+    ) -> None:
+        """
+        Fills the buffers with distances and previous nodes of the shortest paths from the start.
+        The search stops when the goal is reached, the whole reachable part is searched without it.
+        """
+        self._stamp += 1
+        self.searches += 1
+        stamp = self._stamp
+
+        offsets, targets, weights = network.offsets, network.targets, network.weights
+        dist, prev, seen, done = self._dist, self._prev, self._seen, self._done
+        heap = self._heap
+        heap.clear()
+
+        dist[start_idx] = 0.0
+        prev[start_idx] = -1
+        seen[start_idx] = stamp
+        heap.append((0.0, start_idx))
+
+        while heap:
+            _, node_idx = heappop(heap)
+            if done[node_idx] == stamp:
+                continue
+
+            done[node_idx] = stamp
+            if node_idx == goal_idx:
+                break
+
+            node_dist = dist[node_idx]
+            for k in range(offsets[node_idx], offsets[node_idx + 1]):
+                adj_idx = targets[k]
+                adj_dist = node_dist + weights[k]
+
+                if seen[adj_idx] != stamp or adj_dist < dist[adj_idx]:
+                    estimate = adj_dist if heuristic is None else adj_dist + heuristic[adj_idx]
+                    if estimate == inf:
+                        continue
+
+                    seen[adj_idx] = stamp
+                    dist[adj_idx] = adj_dist
+                    prev[adj_idx] = node_idx
+                    heappush(heap, (estimate, adj_idx))
+
+    def _distances(self, network: RoadNetwork, start_idx: int) -> list[float]:
+        self._search(network, start_idx)
+        stamp = self._stamp
+        return [dist if seen == stamp else inf for dist, seen in zip(self._dist, self._seen)]
+
+    def _path_to(self, goal_idx: int) -> list[int]:
+        """
+        Path to the goal found by the last search, without its start.
+        """
+        if self._done[goal_idx] != self._stamp:
+            return []
+
+        path = []
+        node_idx = goal_idx
+        while self._prev[node_idx] != -1:
+            path.append(node_idx)
+            node_idx = self._prev[node_idx]
+
+        path.reverse()
+        return path
+
+    def shortest_path(self, start_idx: int, goal_idx: int) -> list[int]:
+        """
+        Indexes of nodes of the shortest path without its start, empty if there is no path.
+        """
+        self._search(self.network, start_idx, goal_idx, self._heuristic(goal_idx))
+        return self._path_to(goal_idx)
+
+    def shortest_paths(self, start_idx: int, goal_idxs: list[int]) -> dict[int, list[int]]:
+        """
+        Shortest paths from the start to all the goals found by a single one-to-all search.
+        """
+        self._search(self.network, start_idx)
+        return {goal_idx: self._path_to(goal_idx) for goal_idx in goal_idxs}
+
+    def last_distances(self) -> np.ndarray:
+        """
+        Distances from the start of the last one-to-all search, inf for unreachable nodes.
+        """
+        seen = np.array(self._seen) == self._stamp
+        return np.where(seen, np.array(self._dist), inf)
+
+    def set_weights(self, weights: list[float]) -> None:
+        self.network.weights = weights
+
+    def distances_from(self, start_idx: int) -> list[float]:
+        """
+        Travel times from the start to every node, inf for unreachable nodes.
+        """
+        return self._distances(self.network, start_idx)
+
+
+def find_path(graph: Graph, start_idx: int, goal_idx: int) -> list[Node]:
+    """
+    One-off search, RouteTable keeps its PathFinder between searches.
+    """
+    return [graph[idx] for idx in PathFinder(graph, landmarks=0).shortest_path(start_idx, goal_idx)]
+
+
+class RouteTable:
+    """
+    Cache of shortest paths between nodes of the graph.
+    Paths are found once (lazily, or for every pair of localities with precompute)
+    and kept until the travel time of one of their roads changes.
+    Precomputed paths come from one-to-all searches, distances of these searches are kept
+    to tell which of the paths are still the shortest ones under new travel times.
+    Every distinct path also gets an integer route id, which stays valid forever,
+    so cars keep only the id and their position on the path.
+    """
+    _graph: Graph
+    _finder: PathFinder
+    _trees: dict[int, tuple[np.ndarray, np.ndarray, list[int]]]
+    _tree_routes: set[tuple[int, int]]
+    _routes: dict[tuple[int, int], list[Node]]
+    _route_ids: dict[tuple[int, int], int]
+    _interned_paths: dict[tuple[int, ...], int]
+    _paths: list[tuple[int, ...]]
+
+    def __init__(self, graph: Graph, precompute: bool = False) -> None:
+        self._graph = graph
+        self._finder = PathFinder(graph)
+        self._trees = {}
+        self._tree_routes = set()
+        self._routes = {}
+        self._route_ids = {}
+        self._interned_paths = {}
+        self._paths = []
+
+        if precompute:
+            self.precompute()
+
+    def precompute(self) -> None:
+        """
+        Routes from every locality to all localities, found by one search per locality.
+        """
+        localities = [node.idx for node in self._graph if isinstance(node, Locality)]
+        for start_idx in localities:
+            self._build_tree(start_idx, localities)
+
+    def _build_tree(self, start_idx: int, goal_idxs: list[int]) -> None:
+        """
+        Finds routes from the start to all the goals by one search and keeps its tree
+        as (distances, ids of roads of the routes, goals).
+        """
+        paths = self._finder.shortest_paths(start_idx, goal_idxs)
+        roads = set()
+
+        for goal_idx, path in paths.items():
+            key = (start_idx, goal_idx)
+            self._drop_route(key)
+            self._add_route(start_idx, goal_idx, path)
+            self._tree_routes.add(key)
+
+            prev_idx = start_idx
+            for node_idx in path:
+                roads.add(self._graph[prev_idx][node_idx].idx)
+                prev_idx = node_idx
+
+        self._trees[start_idx] = (
+            self._finder.last_distances(), np.array(sorted(roads), dtype=np.int64), goal_idxs)
+
+    def update_weights(self, weights: list[float]) -> int:
+        """
+        Sets new travel times of roads, they must not be lower than the free flow ones.
+        Routes of an origin tree are searched again only if one of their roads has changed its time
+        or some road (u, v) is a shortcut, dist[u] + w < dist[v] for the kept distances.
+        Otherwise no path is shorter than dist[goal] by the triangle inequality,
+        while the routes still cost exactly that much.
+        Routes found without a tree are dropped and found again when they are needed.
+        Returns the number of searched trees.
+        """
+        old_weights = np.array(self._finder.network.weights)
+        new_weights = np.array(weights)
+        self._finder.set_weights(weights)
+
+        changed = old_weights != new_weights
+        if not changed.any():
+            return 0
+
+        for key in [key for key in self._routes if key not in self._tree_routes]:
+            self._drop_route(key)
+
+        store = self._graph.edge_store
+        from_idx = store.from_idx[:len(store)]
+        to_idx = store.to_idx[:len(store)]
+
+        searched = 0
+        for start_idx, (dist, route_roads, goal_idxs) in list(self._trees.items()):
+            if changed[route_roads].any() or (dist[from_idx] + new_weights < dist[to_idx]).any():
+                self._build_tree(start_idx, goal_idxs)
+                searched += 1
+
+        return searched
+
+    def route(self, start_idx: int, goal_idx: int) -> list[Node]:
+        """
+        Returns the cached list itself, it is shared and must not be modified.
+        """
+        key = (start_idx, goal_idx)
+        route = self._routes.get(key)
+        if route is not None:
+            return route
+
+        return self._add_route(start_idx, goal_idx, self._finder.shortest_path(start_idx, goal_idx))
+
+    def _add_route(self, start_idx: int, goal_idx: int, path: list[int]) -> list[Node]:
+        key = (start_idx, goal_idx)
+        route = [self._graph[idx] for idx in path]
+        self._routes[key] = route
+        return route
+
+    def route_id(self, start_idx: int, goal_idx: int) -> int:
+        key = (start_idx, goal_idx)
+        route_id = self._route_ids.get(key)
+        if route_id is not None:
+            return route_id
+
+        route_id = self.intern_path(tuple(node.idx for node in self.route(start_idx, goal_idx)))
+        self._route_ids[key] = route_id
+        return route_id
+
+    def intern_path(self, path: tuple[int, ...]) -> int:
+        """
+        Returns the route id of the path, path is given without its start as in path().
+        """
+        route_id = self._interned_paths.get(path)
+        if route_id is None:
+            route_id = len(self._paths)
+            self._paths.append(path)
+            self._interned_paths[path] = route_id
+
+        return route_id
+
+    def path(self, route_id: int) -> tuple[int, ...]:
+        """
+        Indexes of nodes of the route without its start.
+        """
+        return self._paths[route_id]
+
+    def _drop_route(self, key: tuple[int, int]) -> None:
+        self._routes.pop(key, None)
+        self._route_ids.pop(key, None)
+        self._tree_routes.discard(key)
+
+    def clear(self) -> None:
+        """
+        Ids of the dropped routes stay valid for the cars using them.
+        """
+        self._trees.clear()
+        self._tree_routes.clear()
+        self._routes.clear()
+        self._route_ids.clear()
+
+    @property
+    def searches(self) -> int:
+        """
+        Number of path searches made by the table.
+        """
+        return self._finder.searches
+
+    def __len__(self) -> int:
+        return len(self._routes)
@@ -0,0 +1,183 @@
+"""
+Signal plans computed off the simulation loop.
+
+A background process keeps its own copy of the graph and runs optimize_graph over snapshots
+of numbers of cars on roads. New times of stoplights come back as plans, which the simulation
+applies with Junction.update_stoplight_times, so they take effect at the next cycle boundary
+of every light. Only one snapshot is planned at a time: the simulation sends the next one
+after it has applied the plans of the previous one and never waits for the planner.
+"""
+
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from statistics import mean
+from time import perf_counter
+from datetime import timedelta
+
+import numpy as np
+
+from graph import Graph, Junction
+from optimizer import IncrementalOptimizer, optimize_graph, reachable_junctions
+
+
+# (junction idx, adjacent node idx, green, red) of a stoplight with new times
+Plan = tuple[int, int, int, int]
+
+
+def _plan_signals(connection: Connection, graph: Graph, incremental: bool, interval: timedelta) -> None:
+    store = graph.edge_store
+    junctions = reachable_junctions(graph)
+    incremental_optimizer = IncrementalOptimizer(graph, interval) if incremental else None
+    previous_cars = store.cars[:len(store)].copy()
+
+    while (snapshot := connection.recv()) is not None:
+        now, cars = snapshot
+
+        store.cars[:len(store)] = cars
+        store.changed[:len(store)] |= cars != previous_cars
+        previous_cars = cars
+
+        try:
+            if incremental_optimizer is None:
+                updated = optimize_graph(graph, junctions)
+            else:
+                updated = incremental_optimizer.optimize(now)
+        except ValueError as error:
+            # the simulation raises it, as the optimizer would in the simulation itself
+            connection.send(error)
+            continue
+
+        plans: list[Plan] = []
+        for junction in updated:
+            for node_idx, stoplight in junction.stoplights.items():
+                plan = stoplight.plan()
+                if plan['switch_at'] is None:
+                    continue
+
+                plans.append((junction.idx, node_idx, plan['next_green'], plan['next_red']))
+                # the simulation switches within a cycle, the next plans start from the new times
+                stoplight.commit_times(stoplight.last_update)
+
+        connection.send(plans)
+
+    connection.close()
+
+
+class AsyncOptimizer:
+    """
+    Sends snapshots of cars on roads to the planner process and applies plans which have come back.
+    Latency of a plan is counted from the snapshot it is based on to its application,
+    in simulated ticks and in wall-clock seconds, switch delay is the simulated time
+    from the application to the cycle boundary when the new times start.
+    Runs depend on the speed of the planner, so they are not reproducible.
+    """
+    snapshots: int
+    applied: int
+    rejected: int
+    latency_ticks: list[int]
+    latency_seconds: list[float]
+    switch_delays: list[int]
+
+    def __init__(self, graph: Graph, incremental: bool = False, interval: timedelta = timedelta()) -> None:
+        self._graph = graph
+        self._pending: tuple[int, float] | None = None
+
+        self.snapshots = 0
+        self.applied = 0
+        self.rejected = 0
+        self.latency_ticks = []
+        self.latency_seconds = []
+        self.switch_delays = []
+
+        self._connection, worker_connection = Pipe()
+        self._process = Process(
+            target=_plan_signals, args=(worker_connection, graph, incremental, interval), daemon=True)
+        self._process.start()
+
+    def poll(self, tick: int, now: int, clock: int) -> list[Junction]:
+        """
+        Applies plans if they are ready and sends a new snapshot to the idle planner.
+        Returns junctions whose stoplights got new times.
+        """
+        updated = []
+
+        if self._pending is not None:
+            if not self._connection.poll():
+                return updated
+            updated = self._receive(tick, clock)
+
+        self._send(tick, now)
+        return updated
+
+    def plan_now(self, tick: int, now: int, clock: int) -> list[Junction]:
+        """
+        Plans the current snapshot and waits for its plans, e.g. to compare them with inline optimization.
+        Plans of a snapshot which is still pending are applied first.
+        Returns junctions whose stoplights got new times.
+        """
+        updated = self._receive(tick, clock) if self._pending is not None else []
+
+        self._send(tick, now)
+        return updated + self._receive(tick, clock)
+
+    def _send(self, tick: int, now: int) -> None:
+        store = self._graph.edge_store
+        self._connection.send((now, np.array(store.cars[:len(store)])))
+        self._pending = (tick, perf_counter())
+        self.snapshots += 1
+
+    def _receive(self, tick: int, clock: int) -> list[Junction]:
+        """
+        Waits for plans of the pending snapshot and applies them.
+        """
+        plans: list[Plan] | ValueError = self._connection.recv()
+        snapshot_tick, sent = self._pending
+        self._pending = None
+        if isinstance(plans, ValueError):
+            raise plans
+
+        self.latency_ticks.append(tick - snapshot_tick)
+        self.latency_seconds.append(perf_counter() - sent)
+        return self._apply(plans, clock)
+
+    def _apply(self, plans: list[Plan], clock: int) -> list[Junction]:
+        updated = []
+
+        for junction_idx, node_idx, green, red in plans:
+            junction = self._graph[junction_idx]
+            try:
+                junction.update_stoplight_times(clock, green, red, node_idx)
+            except ValueError:
+                # the planner's copy has drifted from the lights of the simulation
+                self.rejected += 1
+                continue
+
+            self.applied += 1
+            switch_at = junction.stoplights[node_idx].pending_switch()
+            if switch_at is not None:
+                self.switch_delays.append(switch_at - clock)
+            if not updated or updated[-1] is not junction:
+                updated.append(junction)
+
+        return updated
+
+    def summary(self) -> dict[str, float | int]:
+        return {
+            'snapshots': self.snapshots,
+            'planned_snapshots': len(self.latency_ticks),
+            'applied_plans': self.applied,
+            'rejected_plans': self.rejected,
+            'mean_latency_ticks': round(mean(self.latency_ticks), 2) if self.latency_ticks else 0.0,
+            'max_latency_ticks': max(self.latency_ticks, default=0),
+            'mean_latency_ms': round(mean(self.latency_seconds) * 1e3, 3) if self.latency_seconds else 0.0,
+            'max_latency_ms': round(max(self.latency_seconds, default=0.0) * 1e3, 3),
+            'mean_switch_delay_seconds': round(mean(self.switch_delays), 2) if self.switch_delays else 0.0
+        }
+
+    def close(self) -> None:
+        if self._pending is not None:
+            self._connection.recv()
+            self._pending = None
+
+        self._connection.send(None)
+        self._process.join()
@@ -0,0 +1,125 @@
+from array import array
+from time import perf_counter
+from typing import Callable
+import json
+
+from simulation import Simulation
+
+
+COUNTERS = ('moved_cars', 'red_light_stops', 'full_road_stops', 'path_searches')
+
+
+class Profiler:
+    """
+    Wall-clock time of the phases of simulation ticks and per-tick values of simulation counters.
+    attach turns on timing of phases of a single simulation and reads them after every tick,
+    so simulations without a profiler run unchanged.
+    """
+    times: dict[str, float]
+    calls: dict[str, int]
+    counters: dict[str, array]
+    _totals: dict[str, int]
+    _started: float | None
+    _elapsed: float
+
+    def __init__(self) -> None:
+        self.times = {}
+        self.calls = {}
+        self.counters = {name: array('q') for name in COUNTERS}
+        self._totals = {name: 0 for name in COUNTERS}
+        self._started = None
+        self._elapsed = 0.0
+
+    def timed(self, phase: str, function: Callable) -> Callable:
+        """
+        Returns the function, which adds its time to the phase.
+        """
+        self.times.setdefault(phase, 0.0)
+        self.calls.setdefault(phase, 0)
+
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._add(phase, perf_counter() - started)
+
+        return wrapper
+
+    def _add(self, phase: str, seconds: float) -> None:
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def attach(self, simulation: Simulation) -> None:
+        simulation.timing_phases = True
+        simulation.tick_hooks.append(self.on_tick)
+        self._totals = self._read_counters(simulation)
+
+    def on_tick(self, simulation: Simulation) -> None:
+        if self._started is None:
+            self._started = perf_counter() - simulation.phase_times['tick']
+
+        for phase, seconds in simulation.phase_times.items():
+            self._add(phase, seconds)
+
+        totals = self._read_counters(simulation)
+        for name, total in totals.items():
+            self.counters[name].append(total - self._totals[name])
+        self._totals = totals
+
+        self._elapsed = perf_counter() - self._started
+
+    @staticmethod
+    def _read_counters(simulation: Simulation) -> dict[str, int]:
+        return {
+            'moved_cars': simulation.moved_cars,
+            'red_light_stops': simulation.red_light_stops,
+            'full_road_stops': simulation.full_road_stops,
+            'path_searches': simulation.routes.searches
+        }
+
+    def summary(self) -> dict:
+        """
+        Times of phases in seconds with their shares of the run time,
+        and totals, means and maximums of counters per tick.
+        """
+        ticks = len(self.counters['moved_cars'])
+
+        phases = {
+            phase: {
+                'seconds': round(seconds, 6),
+                'calls': self.calls[phase],
+                'share': round(seconds / self._elapsed, 4) if self._elapsed else 0.0,
+                'per_tick_us': round(seconds / ticks * 1e6, 2) if ticks else 0.0
+            }
+            for phase, seconds in self.times.items()
+        }
+        counters = {
+            name: {
+                'total': sum(values),
+                'mean_per_tick': round(sum(values) / ticks, 3) if ticks else 0.0,
+                'max_per_tick': max(values, default=0)
+            }
+            for name, values in self.counters.items()
+        }
+
+        return {'ticks': ticks, 'seconds': round(self._elapsed, 6), 'phases': phases, 'counters': counters}
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"{summary['ticks']} ticks in {summary['seconds']:.2f} s"]
+
+        for phase, stats in sorted(summary['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(
+                f"  {phase:<12}{stats['seconds']:>10.3f} s {stats['share']:>8.1%} {stats['per_tick_us']:>10.1f} us/tick")
+
+        for name, stats in summary['counters'].items():
+            lines.append(
+                f"  {name:<16}{stats['total']:>10} total {stats['mean_per_tick']:>10.3f} per tick, "
+                f"max {stats['max_per_tick']}")
+
+        return "\n".join(lines)
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, 'w', encoding='utf-8') as file:
+            json.dump(self.summary(), file, indent=4)
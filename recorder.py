@@ -0,0 +1,185 @@
+"""
+Streaming statistics of a simulation.
+
+A recording is a directory of append-only files of fixed-size little-endian records,
+their layouts are kept in meta.json:
+    edges.bin: every interval, the moment and the cars and workload of every road,
+    junctions.bin: every interval, the moment and the number of cars waiting at every junction,
+    trips.bin: every finished trip, its start and end nodes, departure and arrival.
+Moments are seconds since the start of the simulation, clock is the time of the day.
+Records are buffered and written in chunks, so memory stays bounded however long the run is,
+and the files can be read with numpy.memmap while the simulation is still running.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from graph import Graph, Junction
+from simulation import Simulation
+
+
+VERSION = 1
+
+# approximate size of a buffered chunk of every file
+CHUNK_BYTES = 1 << 22
+
+TRIP = np.dtype([
+    ('start', '<i4'),
+    ('end', '<i4'),
+    ('departure', '<i8'),
+    ('arrival', '<i8')
+])
+
+
+def edge_record(edges: int) -> np.dtype:
+    return np.dtype([
+        ('moment', '<i8'),
+        ('clock', '<i8'),
+        ('cars', '<i4', (edges,)),
+        ('workload', '<f4', (edges,))
+    ])
+
+
+def junction_record(junctions: int) -> np.dtype:
+    return np.dtype([
+        ('moment', '<i8'),
+        ('clock', '<i8'),
+        ('queue', '<i4', (junctions,))
+    ])
+
+
+class _ChunkedFile:
+    """
+    Records buffered in a preallocated array and appended to the file when it is full.
+    """
+    def __init__(self, filepath: str, dtype: np.dtype) -> None:
+        self._file = open(filepath, 'ab')
+        self._buffer = np.zeros(max(1, CHUNK_BYTES // dtype.itemsize), dtype=dtype)
+        self._size = 0
+
+    def next_record(self) -> np.void:
+        """
+        Returns the next free record of the buffer, which is flushed once full.
+        """
+        if self._size == len(self._buffer):
+            self.flush()
+
+        self._size += 1
+        return self._buffer[self._size - 1]
+
+    def flush(self) -> None:
+        self._file.write(self._buffer[:self._size].tobytes())
+        self._file.flush()
+        self._size = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+class StatsRecorder:
+    """
+    Writes statistics of a simulation into a directory every interval seconds of simulated time.
+    attach makes the simulation report finished trips and record after its ticks,
+    simulations without a recorder do not pay for it.
+    """
+    directory: str
+    interval: int
+    junctions: list[int]
+
+    def __init__(self, directory: str, graph: Graph, interval: int = 300) -> None:
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.interval = interval
+        self.junctions = [node.idx for node in graph if isinstance(node, Junction)]
+
+        self._graph = graph
+        self._junction_columns = np.full(len(graph.nodes), -1, dtype=np.int64)
+        self._junction_columns[self.junctions] = np.arange(len(self.junctions))
+
+        edge_dtype = edge_record(len(graph.edges))
+        junction_dtype = junction_record(len(self.junctions))
+
+        self._edges = _ChunkedFile(os.path.join(directory, 'edges.bin'), edge_dtype)
+        self._junctions = _ChunkedFile(os.path.join(directory, 'junctions.bin'), junction_dtype)
+        self._trips = _ChunkedFile(os.path.join(directory, 'trips.bin'), TRIP)
+
+        store = graph.edge_store
+        meta = {
+            'version': VERSION,
+            'interval': interval,
+            'edges': len(graph.edges),
+            'from_idx': store.from_idx[:len(store)].tolist(),
+            'to_idx': store.to_idx[:len(store)].tolist(),
+            'junctions': self.junctions,
+            'dtypes': {
+                'edges': np.lib.format.dtype_to_descr(edge_dtype),
+                'junctions': np.lib.format.dtype_to_descr(junction_dtype),
+                'trips': np.lib.format.dtype_to_descr(TRIP)
+            }
+        }
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+    def attach(self, simulation: Simulation) -> None:
+        simulation.on_trip = self.record_trip
+        simulation.tick_hooks.append(self.on_tick)
+
+    def on_tick(self, simulation: Simulation) -> None:
+        if simulation.now % self.interval < simulation.delta_seconds:
+            self.record(simulation)
+
+    def record_trip(self, start_idx: int, end_idx: int, departure: int, arrival: int) -> None:
+        record = self._trips.next_record()
+        record['start'] = start_idx
+        record['end'] = end_idx
+        record['departure'] = departure
+        record['arrival'] = arrival
+
+    def record(self, simulation: Simulation) -> None:
+        """
+        Records cars and workloads of roads and queues of junctions at the current moment.
+        """
+        store = self._graph.edge_store
+        cars = store.cars[:len(store)]
+
+        record = self._edges.next_record()
+        record['moment'] = simulation.now
+        record['clock'] = simulation.clock
+        record['cars'] = cars
+        record['workload'] = store.workloads()
+
+        # cars of a lane reach the end of the road in their order, so waiting ones are at its head
+        now = simulation.now
+        arrivals = simulation.cars.arrival
+        queues = np.zeros(len(self.junctions), dtype=np.int64)
+        for edge_idx in np.flatnonzero(cars).tolist():
+            edge = self._graph.edges[edge_idx]
+            column = self._junction_columns[edge.to_idx]
+            queue = simulation.cars_edges.get(edge)
+            if column < 0 or queue is None:
+                continue
+
+            waiting = 0
+            for lane_cars in queue.lanes.values():
+                for car in lane_cars:
+                    if arrivals[car] > now:
+                        break
+                    waiting += 1
+            queues[column] += waiting
+
+        record = self._junctions.next_record()
+        record['moment'] = simulation.now
+        record['clock'] = simulation.clock
+        record['queue'] = queues
+
+    def flush(self) -> None:
+        for file in (self._edges, self._junctions, self._trips):
+            file.flush()
+
+    def close(self) -> None:
+        for file in (self._edges, self._junctions, self._trips):
+            file.close()
@@ -0,0 +1,27 @@
+from heapq import heappush, heappop
+
+
+class EventQueue:
+    """
+    Priority queue of moments (in ticks) when roads have to be visited:
+    a car reaches the end of the road or the light it waits at can turn green.
+    """
+    _heap: list[tuple[int, int]]
+
+    def __init__(self) -> None:
+        self._heap = []
+
+    def push(self, tick: int, edge_idx: int) -> None:
+        heappush(self._heap, (tick, edge_idx))
+
+    def pop_due(self, tick: int) -> list[int]:
+        """
+        Removes all events up to the tick and returns ids of their roads in ascending order.
+        """
+        due = set()
+        while self._heap and self._heap[0][0] <= tick:
+            due.add(heappop(self._heap)[1])
+        return sorted(due)
+
+    def __len__(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,537 @@
+from __future__ import annotations
+from collections import deque
+from heapq import heapify, heappop, heapreplace
+from json import dump, load
+from datetime import timedelta
+from time import perf_counter
+from typing import Callable, Iterable, TypeVar
+
+import numpy as np
+
+from graph import Graph, Locality, CarsFactory, Edge, Junction, OUT_LIGHT
+from carpool import CarPool, RoadQueue, ARRIVING_LANE
+from demand import Demand
+from distributor import DepartureSchedule
+from pathfinder import RouteTable
+from optimizer import optimize_graph, IncrementalOptimizer
+from planner import AsyncOptimizer
+from tools import calc_roads_times
+from meter import calc_avg_workload
+from scheduler import EventQueue
+from mapfile import is_binary_map, load_binary_map
+
+
+DELTA = timedelta(seconds=3)
+MOD = timedelta(days=1)
+SECOND = timedelta(seconds=1)
+HOUR_BORDER = timedelta(hours=1)
+
+DAY_SECONDS = MOD // SECOND
+HOUR_SECONDS = HOUR_BORDER // SECOND
+
+T = TypeVar('T')
+
+
+def load_graph(filepath: str = './map.json', rng: np.random.Generator | None = None) -> Graph:
+    """
+    Loads the graph from a json map or from a binary map compiled by mapfile.py.
+    """
+    if is_binary_map(filepath):
+        return load_binary_map(filepath, rng)
+
+    with open(filepath, 'r', encoding='utf-8') as file:
+        json = load(file)
+
+    try:
+        j_nodes = json["nodes"]
+        nodes = [
+            j_node if j_node[0] == "locality"
+            else j_node[:3] + [
+                {int(k): v for k, v in j_node_dict.items()}
+                for j_node_dict in j_node[3:5]
+            ]
+            for j_node in j_nodes
+        ]
+        roads = json["roads"]
+        return Graph(nodes, roads, rng)
+    except KeyError as e:
+        raise KeyError("Incorrect json format") from e
+
+
+def save_signal_plans(graph: Graph, filepath: str) -> None:
+    """
+    Saves times of the stoplights of every junction as json.
+    """
+    plans = [node.signal_plan() for node in graph if isinstance(node, Junction)]
+
+    with open(filepath, 'w', encoding='utf-8') as file:
+        dump(plans, file, indent=4)
+
+
+class Simulation:
+    """
+    Traffic of the graph simulated tick by tick, DELTA seconds each.
+    In event driven mode only the roads with due events are visited on a tick,
+    otherwise every car on every road is checked (compatibility mode).
+    The clock is kept in integer seconds, delta and time are its timedelta views.
+    Travel times of roads are free flow ones, or follow the workloads of roads
+    and are refreshed every congestion interval.
+    """
+    graph: Graph
+    routes: RouteTable
+    cars_factory: CarsFactory
+    cars: CarPool
+    cars_edges: dict[Edge, RoadQueue]
+    cars_nodes: dict[int, deque[int]]
+    localities: list[Locality]
+    events: EventQueue | None
+    optimized: bool
+    incremental_optimizer: IncrementalOptimizer | None
+    planner: AsyncOptimizer | None
+    departures: DepartureSchedule
+    demand: Demand
+    road_times: list[float]
+    congestion_interval: int | None
+    # called with the start and end nodes, departure and arrival of every finished trip
+    on_trip: Callable[[int, int, int, int], None] | None
+    # called with the simulation at the end of every tick, in the order of the list
+    tick_hooks: list[Callable[[Simulation], None]]
+    # seconds spent in the phases of the last tick, measured only if timing_phases is set
+    timing_phases: bool
+    phase_times: dict[str, float]
+    delta: timedelta
+    delta_seconds: int
+    clock: int
+    tick: int
+
+    # counters of the whole simulation, lanes stopped by a red light or a full next road are counted once per visit
+    moved_cars: int
+    red_light_stops: int
+    full_road_stops: int
+
+    def __init__(
+        self,
+        graph: Graph,
+        optimized: bool = False,
+        event_driven: bool = True,
+        delta: timedelta = DELTA,
+        rng: np.random.Generator | None = None,
+        incremental: bool = False,
+        control_interval: timedelta = timedelta(),
+        congestion_interval: timedelta | None = None,
+        departures: DepartureSchedule | None = None,
+        asynchronous: bool = False
+    ) -> None:
+        """
+        With incremental optimization only junctions with changed traffic are re-planned,
+        at most once per control interval.
+        With congestion interval travel times of roads and routes of new cars
+        are updated from the current traffic once per interval.
+        Departures follow the Gaussian morning and evening peaks unless a schedule is given.
+        Asynchronous optimization plans stoplights in a background process and applies the plans
+        when they are ready, the planner must be closed after the run.
+        """
+        self.graph = graph
+        self.routes = RouteTable(graph, precompute=True)
+        self.cars_factory = CarsFactory(graph, self.routes, rng)
+
+        self.cars = CarPool()
+        self.cars_edges = {edge: RoadQueue() for edge in graph.edges}
+        self.cars_nodes = {idx: deque() for idx in range(len(graph.nodes))}
+        self.localities = [node for node in graph if isinstance(node, Locality)]
+
+        self.events = EventQueue() if event_driven else None
+        self.optimized = optimized
+        self.planner = AsyncOptimizer(graph, incremental, control_interval) if optimized and asynchronous else None
+        self.incremental_optimizer = (
+            IncrementalOptimizer(graph, control_interval) if incremental and self.planner is None else None)
+
+        self.delta = delta
+        self.delta_seconds = delta // SECOND
+        self.departures = DepartureSchedule(delta) if departures is None else departures
+        self.demand = Demand(self.localities, self.departures)
+
+        self.road_times = calc_roads_times(graph.edge_store).tolist()
+        self.congestion_interval = (
+            None if congestion_interval is None
+            else max(1, congestion_interval // delta)
+        )
+        self.clock = DAY_SECONDS - self.delta_seconds
+        self.tick = 0
+
+        self.on_trip = None
+        self.tick_hooks = []
+        self.timing_phases = False
+        self.phase_times = {}
+
+        self.moved_cars = 0
+        self.red_light_stops = 0
+        self.full_road_stops = 0
+
+    @property
+    def ticks_per_day(self) -> int:
+        return DAY_SECONDS // self.delta_seconds
+
+    @property
+    def time(self) -> timedelta:
+        """
+        Time of the current day.
+        """
+        return timedelta(seconds=self.clock)
+
+    def check_hour_border(self) -> bool:
+        a = self.clock // HOUR_SECONDS
+        b = (self.clock + self.delta_seconds) // HOUR_SECONDS
+        return a < b
+
+    @property
+    def now(self) -> int:
+        """
+        Seconds since the start of the simulation, arrivals of cars are kept in this clock.
+        """
+        return self.tick * self.delta_seconds
+
+    def arrival_tick(self, arrival: int) -> int:
+        """
+        First tick when the clock reaches the arrival (in seconds since the start).
+        """
+        return self.tick + max(1, -((self.now - arrival) // self.delta_seconds))
+
+    def moment_to_tick(self, moment: int) -> int:
+        """
+        First tick when the clock reaches moment (in seconds of the current day).
+        Moments beyond the current day are moved to its first tick, since the clock wraps there.
+        """
+        step = self.delta_seconds
+
+        ticks_left = (DAY_SECONDS - self.clock - 1) // step
+        ticks_ahead = -((self.clock - moment) // step)
+        return self.tick + max(1, min(ticks_ahead, ticks_left + 1))
+
+    def _arrival(self, road: Edge) -> int:
+        """
+        Returns the moment when cars entering the road now reach its end.
+        """
+        return self.now + round(self.road_times[road.idx])
+
+    def _lane_arrival(self, queue: RoadQueue, lane: int, cars: Iterable[int], arrival: int) -> int:
+        """
+        Cars do not overtake each other inside a lane, so they cannot reach the end of the road
+        before the last car of the lane, even if the road has become faster.
+        Returns the arrival of the cars.
+        """
+        lane_cars = queue.lanes.get(lane)
+        if lane_cars and self.cars.arrival[lane_cars[-1]] > arrival:
+            arrival = self.cars.arrival[lane_cars[-1]]
+            for car in cars:
+                self.cars.arrival[car] = arrival
+
+        return arrival
+
+    def _enter(self, road: Edge, cars: Iterable[int], lane: int, arrival: int) -> None:
+        """
+        Puts cars, which have been admitted onto the road and reach its end at arrival, into the lane.
+        """
+        queue = self.cars_edges[road]
+        arrival = self._lane_arrival(queue, lane, cars, arrival)
+        queue.extend(cars, lane)
+
+        if self.events is not None:
+            self.events.push(self.arrival_tick(arrival), road.idx)
+
+    def distribute_new_cars(self, locality: Locality, destinations: list[tuple[int, int]]) -> None:
+        """
+        Admits new cars onto the first roads of their routes in bulk, as many as the roads can hold.
+        The rest of the cars stay at home.
+        """
+        for dest_idx, amount in destinations:
+            route_id = self.routes.route_id(locality.idx, dest_idx)
+            path = self.routes.path(route_id)
+            if not path:
+                continue
+
+            road = locality.output_roads[path[0]]
+            admitted = road.admit_cars(amount)
+            if admitted == 0:
+                continue
+
+            arrival = self._arrival(road)
+            self._enter(
+                road,
+                self.cars.add_many(admitted, locality.idx, dest_idx, route_id, arrival, self.now),
+                path[1] if len(path) > 1 else ARRIVING_LANE,
+                arrival
+            )
+
+    def distribute_guest_cars(self, locality: Locality, amount: int) -> None:
+        """
+        Sends the first amount guests of the locality home.
+        They are admitted onto the first roads of their paths in bulk, as many as the roads can hold,
+        the rest keep waiting in the locality.
+        """
+        cars = self.cars
+        guest_cars = self.cars_nodes[locality.idx]
+        leaving_cars = [guest_cars.popleft() for _ in range(min(amount, len(guest_cars)))]
+
+        cars_by_roads: dict[Edge, list[tuple[int, int]]] = {}
+        for car in leaving_cars:
+            route_id = self.routes.route_id(locality.idx, cars.origin[car])
+            if not self.routes.path(route_id):
+                continue
+
+            road = locality.output_roads[self.routes.path(route_id)[0]]
+            cars_by_roads.setdefault(road, []).append((car, route_id))
+
+        left_cars = set()
+        for road, road_cars in cars_by_roads.items():
+            admitted = road.admit_cars(len(road_cars))
+            if admitted == 0:
+                continue
+
+            arrival = self._arrival(road)
+            lanes: dict[int, list[int]] = {}
+            for car, route_id in road_cars[:admitted]:
+                path = self.routes.path(route_id)
+                cars.route[car] = route_id
+                cars.position[car] = 0
+                cars.arrival[car] = arrival
+                cars.departure[car] = self.now
+
+                left_cars.add(car)
+                lanes.setdefault(path[1] if len(path) > 1 else ARRIVING_LANE, []).append(car)
+
+            for lane, lane_cars in lanes.items():
+                self._enter(road, lane_cars, lane, arrival)
+
+        # guests which have not left keep their places in the queue
+        guest_cars.extendleft(reversed([car for car in leaving_cars if car not in left_cars]))
+
+    def generate_cars(self) -> None:
+        localities = self.localities
+        guests = np.fromiter(
+            (len(self.cars_nodes[locality.idx]) for locality in localities), dtype=np.int64, count=len(localities))
+        natives, leaving_guests = self.demand.departures(self.clock, guests)
+
+        for position in np.flatnonzero(natives + leaving_guests).tolist():
+            locality = localities[position]
+
+            self.distribute_new_cars(
+                locality,
+                self.cars_factory.generate_destinations(locality.idx, int(natives[position]))
+            )
+
+            self.distribute_guest_cars(locality, int(leaving_guests[position]))
+
+    def drive_edge(self, edge: Edge, queue: RoadQueue) -> int | None:
+        """
+        Moves cars, which have reached the end of the edge, further.
+        Cars leave every lane from its head, in the order of arrival across lanes,
+        until the junction bandwidth is used up; a red light or a full next road stops the lane.
+        Returns the tick when cars left waiting at the end of the edge can move, if there are such cars.
+        """
+        time = self.clock
+        now = self.now
+        road_times = self.road_times
+        cars = self.cars
+        arrivals = cars.arrival
+        on_trip = self.on_trip
+        wake_tick = None
+        number_passed_cars = 0
+
+        cur_node = self.graph[edge.to_idx]
+        is_junction = isinstance(cur_node, Junction)
+
+        heads = [
+            (arrivals[lane_cars[0]], lane, lane_cars)
+            for lane, lane_cars in queue.lanes.items()
+            if lane_cars and arrivals[lane_cars[0]] <= now
+        ]
+        heapify(heads)
+
+        green_lights = cur_node.green_lights(time) if is_junction and heads else 0
+
+        while heads:
+            if is_junction and number_passed_cars >= cur_node.bandwidth:
+                return self.tick + 1
+
+            _, lane, lane_cars = heads[0]
+            car = lane_cars[0]
+
+            if lane == ARRIVING_LANE:
+                lane_cars.popleft()
+                edge.update_cars(edge.cars - 1)
+
+                is_home = cur_node.idx == cars.origin[car]
+                if on_trip is not None:
+                    on_trip(
+                        cars.destination[car] if is_home else cars.origin[car], cur_node.idx, cars.departure[car], now)
+
+                if is_home:
+                    cars.release(car)
+                else:
+                    self.cars_nodes[cur_node.idx].append(car)
+                self.moved_cars += 1
+
+            else:
+                if is_junction:
+                    stoplight = cur_node.stoplights.get(lane)
+                    red_stoplight = (
+                        cur_node.out_stoplight if not green_lights & OUT_LIGHT
+                        else stoplight if stoplight is not None and not green_lights & cur_node.light_bits[lane]
+                        else None
+                    )
+
+                    if red_stoplight is not None:
+                        self.red_light_stops += 1
+                        green_tick = self.moment_to_tick(red_stoplight.next_green(time))
+                        wake_tick = green_tick if wake_tick is None else min(wake_tick, green_tick)
+                        heappop(heads)
+                        continue
+
+                next_road = cur_node.output_roads[lane]
+                if next_road.admit_cars(1) == 0:
+                    self.full_road_stops += 1
+                    wake_tick = self.tick + 1
+                    heappop(heads)
+                    continue
+
+                lane_cars.popleft()
+                edge.update_cars(edge.cars - 1)
+                number_passed_cars += 1
+                self.moved_cars += 1
+
+                path = self.routes.path(cars.route[car])
+                position = cars.position[car] + 1
+                arrival = now + round(road_times[next_road.idx])
+                cars.arrival[car] = arrival
+                cars.position[car] = position
+
+                self._enter(
+                    next_road, (car,), path[position + 1] if position + 1 < len(path) else ARRIVING_LANE, arrival)
+
+            if lane_cars and arrivals[lane_cars[0]] <= now:
+                heapreplace(heads, (arrivals[lane_cars[0]], lane, lane_cars))
+            else:
+                heappop(heads)
+
+        return wake_tick
+
+    def cars_driving(self) -> None:
+        if self.events is None:
+            for edge, queue in self.cars_edges.items():
+                self.drive_edge(edge, queue)
+            return
+
+        # roads are visited in the same order as in compatibility mode, so both give the same results
+        for edge_idx in self.events.pop_due(self.tick):
+            edge = self.graph.edges[edge_idx]
+            wake_tick = self.drive_edge(edge, self.cars_edges[edge])
+
+            if wake_tick is not None:
+                self.events.push(wake_tick, edge_idx)
+
+    def refresh_road_times(self) -> None:
+        """
+        Travel times of roads follow their current workloads, new cars get routes found for these times.
+        """
+        self.road_times = calc_roads_times(self.graph.edge_store, congestion=True).tolist()
+        self.routes.update_weights(self.road_times)
+
+    def measure_workload(self) -> float:
+        return calc_avg_workload(self.graph)
+
+    def optimize(self) -> None:
+        if self.planner is not None:
+            updated_junctions = self.planner.poll(self.tick, self.now, self.clock)
+        elif self.incremental_optimizer is None:
+            updated_junctions = optimize_graph(self.graph)
+        else:
+            updated_junctions = self.incremental_optimizer.optimize(self.now)
+
+        self._wake_junctions(updated_junctions)
+
+    def _wake_junctions(self, junctions: list[Junction]) -> None:
+        if self.events is None:
+            return
+
+        # stoplights got new times, so cars waiting at them are checked again
+        for junction in junctions:
+            for node_idx in junction.input_nodes:
+                self.events.push(self.tick + 1, self.graph[node_idx][junction.idx].idx)
+
+    def step(self, on_draw: Callable[[Graph, timedelta], None] | None = None) -> tuple[int, float] | None:
+        """
+        Simulates one tick.
+        Returns the hour and the average workload, if the hour has just ended.
+        """
+        if self.timing_phases:
+            self.phase_times = {}
+            started = perf_counter()
+
+        if self.congestion_interval is not None and self.tick > 0 and self.tick % self.congestion_interval == 0:
+            self._phase('congestion', self.refresh_road_times)
+
+        self._phase('generate', self.generate_cars)
+        if on_draw is not None:
+            on_draw(self.graph, self.time)
+
+        self._phase('driving', self.cars_driving)
+        if on_draw is not None:
+            on_draw(self.graph, self.time)
+
+        if self.optimized:
+            self._phase('optimize', self.optimize)
+
+        hourly_workload = None
+        if self.check_hour_border():
+            hour = (self.clock + self.delta_seconds) % DAY_SECONDS // HOUR_SECONDS
+            hourly_workload = (hour, round(self._phase('measure', self.measure_workload) * 1e4, 3))
+
+        self.clock = (self.clock + self.delta_seconds) % DAY_SECONDS
+        self.tick += 1
+
+        if self.timing_phases:
+            self.phase_times['tick'] = perf_counter() - started
+
+        for hook in self.tick_hooks:
+            hook(self)
+
+        return hourly_workload
+
+    def _phase(self, name: str, method: Callable[[], T]) -> T:
+        if not self.timing_phases:
+            return method()
+
+        started = perf_counter()
+        result = method()
+        self.phase_times[name] = perf_counter() - started
+        return result
+
+    def run(
+        self,
+        days: int | None = None,
+        seed: int | None = None,
+        on_hour: Callable[[int, float], None] | None = None,
+        on_draw: Callable[[Graph, timedelta], None] | None = None
+    ) -> list[float]:
+        """
+        Simulates the given number of days, or forever if days is None.
+        A seed replaces the random generator of cars, the initial lights are chosen when the graph is built.
+        Returns average workloads of every simulated hour.
+        """
+        if seed is not None:
+            self.cars_factory = CarsFactory(self.graph, self.routes, np.random.default_rng(seed))
+
+        last_tick = None if days is None else self.tick + days * self.ticks_per_day
+        hourly_workloads = []
+
+        while last_tick is None or self.tick < last_tick:
+            hourly_workload = self.step(on_draw)
+            if hourly_workload is None:
+                continue
+
+            hourly_workloads.append(hourly_workload[1])
+            if on_hour is not None:
+                on_hour(*hourly_workload)
+
+        return hourly_workloads
@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import product
+from math import sqrt
+from statistics import mean, stdev
+import argparse
+import csv
+import os
+
+import numpy as np
+
+from simulation import Simulation, load_graph
+
+
+FILEPATH = os.path.join('stat', 'sweep.csv')
+
+# (seed, map path, DELTA in seconds, optimized)
+Configuration = tuple[int, str, int, bool]
+
+
+def run_configuration(configuration: Configuration, days: int) -> list[float]:
+    """
+    Simulates one configuration in a fresh graph.
+    Returns the 24 hourly average workloads averaged over the simulated days.
+    """
+    seed, map_path, delta, optimized = configuration
+
+    rng = np.random.default_rng(seed)
+    simulation = Simulation(
+        load_graph(map_path, rng),
+        optimized=optimized,
+        delta=timedelta(seconds=delta),
+        rng=rng
+    )
+    hourly_workloads = simulation.run(days=days)
+
+    return [mean(hourly_workloads[hour::24]) for hour in range(24)]
+
+
+def confidence_interval(values: list[float], confidence: float) -> tuple[float, float]:
+    if len(values) < 2:
+        return values[0], values[0]
+
+    # t-distribution is imported here to keep scipy out of the simulation workers
+    from scipy.stats import t
+
+    center = mean(values)
+    half_width = t.ppf((1 + confidence) / 2, len(values) - 1) * stdev(values) / sqrt(len(values))
+    return center - half_width, center + half_width
+
+
+def sweep(
+    seeds: list[int],
+    map_paths: list[str],
+    deltas: list[int],
+    optimized_modes: list[bool] = [False, True],
+    days: int = 1,
+    confidence: float = 0.95,
+    max_workers: int | None = None
+) -> list[dict[str, str | int | float | bool]]:
+    """
+    Runs every configuration of the grid in its own worker process.
+    Returns one row for every (map, delta, mode, hour) with the mean workload over seeds
+    and its confidence interval.
+    """
+    configurations: list[Configuration] = list(product(seeds, map_paths, deltas, optimized_modes))
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        results = list(executor.map(run_configuration, configurations, [days] * len(configurations)))
+
+    groups: dict[tuple[str, int, bool], list[list[float]]] = {}
+    for (_, map_path, delta, optimized), hourly_workloads in zip(configurations, results):
+        groups.setdefault((map_path, delta, optimized), []).append(hourly_workloads)
+
+    rows = []
+    for (map_path, delta, optimized), runs in groups.items():
+        for hour in range(24):
+            values = [hourly_workloads[hour] for hourly_workloads in runs]
+            ci_low, ci_high = confidence_interval(values, confidence)
+            rows.append({
+                'map': map_path,
+                'delta': delta,
+                'optimized': optimized,
+                'hour': hour,
+                'runs': len(values),
+                'mean': round(mean(values), 3),
+                'ci_low': round(ci_low, 3),
+                'ci_high': round(ci_high, 3)
+            })
+
+    return rows
+
+
+def save_sweep(rows: list[dict], filepath: str = FILEPATH) -> None:
+    with open(filepath, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare default and optimized modes over a grid of configurations')
+
+    parser.add_argument('--seeds', type=int, nargs='+', default=list(range(8)), help='Seeds of random generators')
+    parser.add_argument('--maps', nargs='+', default=['./map.json'], help='Paths to map files')
+    parser.add_argument('--deltas', type=int, nargs='+', default=[3], help='Tick lengths in seconds')
+    parser.add_argument('--modes', nargs='+', choices=['default', 'optimized'], default=['default', 'optimized'],
+                        help='Modes of the optimizer')
+    parser.add_argument('--days', type=int, default=1, help='Simulated days of every run')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Level of confidence intervals')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes, all cores by default')
+    parser.add_argument('--output', default=FILEPATH, help='Path to the result table')
+
+    args = parser.parse_args()
+
+    rows = sweep(
+        args.seeds,
+        args.maps,
+        args.deltas,
+        [mode == 'optimized' for mode in args.modes],
+        days=args.days,
+        confidence=args.confidence,
+        max_workers=args.workers
+    )
+    save_sweep(rows, args.output)
+    print(f"{len(rows)} rows are saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pytest
+
+from graph import EdgeStore, Graph, Junction
+from mapgen import generate_map, save_map
+
+
+MAP = os.path.join(os.path.dirname(__file__), '..', 'map.json')
+
+
+def light_times(graph: Graph, switches: bool = False) -> dict[tuple[int, int], tuple[int, ...]]:
+    """
+    Planned green and red times of every stoplight, also the moment of its switch if switches is set.
+    """
+    return {
+        (node.idx, node_idx): stoplight.planned_times() + ((stoplight.last_update,) if switches else ())
+        for node in graph if isinstance(node, Junction)
+        for node_idx, stoplight in node.stoplights.items()
+    }
+
+
+def commit_lights(graph: Graph) -> None:
+    """
+    Switches every stoplight with pending times to them, as the simulation does at cycle boundaries.
+    """
+    for node in graph:
+        if isinstance(node, Junction):
+            for stoplight in node.stoplights.values():
+                if stoplight.pending_switch() is not None:
+                    stoplight.commit_times(stoplight.last_update)
+
+
+def random_loads(store: EdgeStore, rng: np.random.Generator) -> np.ndarray:
+    """
+    Random numbers of cars of the roads of the store, up to their volumes.
+    """
+    return (rng.uniform(0, 1, len(store)) * store.volume[:len(store)]).astype(np.int64)
+
+
+@pytest.fixture
+def grid_map_path(tmp_path) -> str:
+    path = str(tmp_path / 'grid.json')
+    save_map(generate_map('grid', 300, seed=1), path)
+    return path
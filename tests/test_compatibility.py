@@ -0,0 +1,56 @@
+from math import gcd
+
+import numpy as np
+
+from graph import StopLight, _are_compatible
+
+
+def are_compatible_by_cycles(green1: int, red1: int, green2: int, red2: int) -> bool:
+    """
+    The loop over cycles which StopLight.is_compatible used before the closed form.
+    """
+    period1 = green1 + red1
+    period2 = green2 + red2
+
+    d = gcd(period1, period2)
+
+    if d > green1 + green2:
+        return True
+
+    max_checks = (period1 * period2) // d
+
+    for k in range(0, max_checks + 1):
+        t1_start = k * period1
+        t1_end = t1_start + green1
+
+        m = (t1_start - red2) // period2
+        for delta in [-1, 0, 1]:
+            current_m = m + delta
+            if current_m < 0:
+                continue
+
+            t2_start = current_m * period2 + red2
+            t2_end = t2_start + green2
+
+            if not (t1_end <= t2_start or t2_end <= t1_start):
+                return False
+
+    return True
+
+
+def test_closed_form_matches_cycles():
+    rng = np.random.default_rng(6)
+
+    for _ in range(20000):
+        green1, red1, green2, red2 = (int(value) for value in rng.integers(0, 130, size=4))
+        if green1 + red1 == 0 or green2 + red2 == 0:
+            continue
+
+        assert _are_compatible(green1, red1, green2, red2) == are_compatible_by_cycles(green1, red1, green2, red2), \
+            (green1, red1, green2, red2)
+
+
+def test_stoplights_use_closed_form():
+    for green1, red1, green2, red2 in [(20, 30, 30, 20), (30, 20, 30, 20), (15, 25, 25, 15), (25, 35, 15, 25)]:
+        assert StopLight(green1, red1).is_compatible(StopLight(green2, red2)) == \
+            are_compatible_by_cycles(green1, red1, green2, red2)
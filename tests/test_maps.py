@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from conftest import commit_lights, random_loads
+from graph import Junction, _are_compatible
+from mapfile import compile_map
+from mapgen import generate_map, save_map
+from optimizer import optimize_graph
+from simulation import load_graph
+
+
+KINDS = ('grid', 'radial', 'planar')
+
+
+def dependencies(graph) -> dict[int, dict[int, list[int]]]:
+    return {
+        node.idx: {int(k): [int(idx) for idx in v] for k, v in dict(node.dependencies).items()}
+        for node in graph if isinstance(node, Junction)
+    }
+
+
+@pytest.fixture(params=KINDS)
+def map_path(request, tmp_path) -> str:
+    path = str(tmp_path / f'{request.param}.json')
+    save_map(generate_map(request.param, 300, seed=1), path)
+    return path
+
+
+def test_loaders_keep_dependencies(map_path, tmp_path):
+    graph = load_graph(map_path)
+    binary_path = str(tmp_path / 'map.bin')
+    compile_map(map_path, binary_path)
+
+    expected = dependencies(graph)
+    assert any(expected.values())
+    assert dependencies(load_graph(binary_path)) == expected
+
+
+def structure(graph) -> list[tuple]:
+    return [
+        (
+            node.idx,
+            {to_idx: edge.idx for to_idx, edge in node.output_roads.items()},
+            list(node.input_nodes),
+            {
+                node_idx: (stoplight.green, stoplight.red, stoplight.initial_light)
+                for node_idx, stoplight in node.stoplights.items()
+            } if isinstance(node, Junction) else None
+        )
+        for node in graph
+    ]
+
+
+def test_binary_loader_builds_the_graph_of_the_json_one(map_path, tmp_path):
+    binary_path = str(tmp_path / 'map.bin')
+    compile_map(map_path, binary_path)
+
+    graph = load_graph(map_path, np.random.default_rng(1))
+    binary_graph = load_graph(binary_path, np.random.default_rng(1))
+
+    assert structure(binary_graph) == structure(graph)
+    assert [(edge.from_idx, edge.to_idx) for edge in binary_graph.edges] == [
+        (edge.from_idx, edge.to_idx) for edge in graph.edges]
+    assert all(binary_graph.edges[edge.idx] is edge for _, edge in binary_graph[0])
+
+
+def test_optimizer_keeps_dependent_stoplights_compatible(map_path):
+    graph = load_graph(map_path, np.random.default_rng(1))
+    store = graph.edge_store
+    rng = np.random.default_rng(2)
+
+    for _ in range(20):
+        store.cars[:len(store)] = random_loads(store, rng)
+        optimize_graph(graph)
+        commit_lights(graph)
+
+        for node in graph:
+            if not isinstance(node, Junction):
+                continue
+
+            for node_idx, opposite_idxs in dict(node.dependencies).items():
+                for opposite_idx in opposite_idxs:
+                    assert _are_compatible(
+                        *node.stoplights[node_idx].planned_times(), *node.stoplights[opposite_idx].planned_times())
@@ -0,0 +1,39 @@
+import numpy as np
+
+from conftest import MAP, light_times, random_loads
+from optimizer import IncrementalOptimizer, optimize_graph
+from simulation import DELTA, Simulation, load_graph
+
+
+def test_incremental_optimizer_plans_like_full_one_when_every_junction_is_dirty(grid_map_path):
+    full = load_graph(grid_map_path, np.random.default_rng(1))
+    incremental = load_graph(grid_map_path, np.random.default_rng(1))
+    optimizer = IncrementalOptimizer(incremental)
+
+    store = full.edge_store
+    rng = np.random.default_rng(2)
+    delta = DELTA.seconds
+    initial = light_times(full, switches=True)
+
+    for tick in range(20):
+        cars = random_loads(store, rng)
+        store.cars[:len(store)] = cars
+        incremental.edge_store.cars[:len(store)] = cars
+        incremental.edge_store.changed[:] = True
+
+        optimize_graph(full)
+        optimizer.optimize(tick * delta)
+
+        assert light_times(incremental, switches=True) == light_times(full, switches=True)
+
+    assert light_times(full, switches=True) != initial
+
+
+def test_incremental_and_full_optimization_simulate_the_same_day():
+    runs = []
+    for incremental in (False, True):
+        rng = np.random.default_rng(3)
+        simulation = Simulation(load_graph(MAP, rng), optimized=True, rng=rng, incremental=incremental)
+        runs.append((simulation.run(days=1), light_times(simulation.graph, switches=True)))
+
+    assert runs[0] == runs[1]
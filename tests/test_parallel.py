@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from conftest import MAP
+from parallel import ParallelSimulation
+from simulation import Simulation, load_graph
+
+
+SEED = 1
+# cars crossing a border and numbers of cars of border roads reach other regions a tick later
+TOLERANCE = 0.05
+
+
+@pytest.fixture(scope='module')
+def single_process() -> list[float]:
+    rng = np.random.default_rng(SEED)
+    return Simulation(load_graph(MAP, rng), rng=rng).run(days=1)
+
+
+def test_one_region_matches_single_process(single_process):
+    assert ParallelSimulation(MAP, 1, SEED).run(days=1) == single_process
+
+
+@pytest.mark.parametrize('regions', [2, 3])
+def test_regions_stay_close_to_single_process(single_process, regions):
+    sharded = ParallelSimulation(MAP, regions, SEED).run(days=1)
+
+    assert len(sharded) == len(single_process) == 24
+    assert np.mean(sharded) == pytest.approx(np.mean(single_process), rel=TOLERANCE)
@@ -0,0 +1,75 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import planner as planner_module
+from conftest import MAP, commit_lights, light_times, random_loads
+from optimizer import optimize_graph
+from planner import AsyncOptimizer
+from simulation import Simulation, load_graph
+
+
+def test_async_plans_match_inline_ones(grid_map_path):
+    inline = load_graph(grid_map_path, np.random.default_rng(1))
+    asynchronous = load_graph(grid_map_path, np.random.default_rng(1))
+    planner = AsyncOptimizer(asynchronous)
+
+    store = inline.edge_store
+    rng = np.random.default_rng(2)
+    changed = 0
+    try:
+        for tick in range(10):
+            cars = random_loads(store, rng)
+            store.cars[:len(store)] = cars
+            asynchronous.edge_store.cars[:len(store)] = cars
+
+            before = light_times(inline)
+            optimize_graph(inline)
+
+            planner.plan_now(tick, tick * 3, tick * 3)
+
+            after = light_times(inline)
+            assert light_times(asynchronous) == after
+            changed += sum(before[light] != after[light] for light in after)
+
+            commit_lights(inline)
+            commit_lights(asynchronous)
+    finally:
+        planner.close()
+
+    assert changed > 0
+    assert planner.applied > 0
+    assert planner.rejected == 0
+
+
+def test_polled_plans_are_applied_during_a_run(grid_map_path):
+    rng = np.random.default_rng(1)
+    simulation = Simulation(load_graph(grid_map_path, rng), optimized=True, rng=rng, asynchronous=True)
+    planner = simulation.planner
+    try:
+        while planner.applied == 0 and simulation.tick < simulation.ticks_per_day:
+            simulation.step()
+    finally:
+        planner.close()
+
+    summary = planner.summary()
+    assert summary['applied_plans'] > 0
+    assert summary['rejected_plans'] == 0
+    assert 0 < summary['planned_snapshots'] <= summary['snapshots']
+    assert summary['mean_latency_ticks'] >= 1
+    assert summary['max_latency_ms'] > 0
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="the worker must inherit the patch")
+def test_errors_of_the_planner_are_raised_in_the_simulation(monkeypatch):
+    def fail(*_):
+        raise ValueError("broken plan")
+
+    monkeypatch.setattr(planner_module, 'optimize_graph', fail)
+    planner = AsyncOptimizer(load_graph(MAP, np.random.default_rng(1)))
+    try:
+        with pytest.raises(ValueError, match="broken plan"):
+            planner.plan_now(0, 0, 0)
+    finally:
+        planner.close()
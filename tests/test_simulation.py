@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from conftest import MAP
+from simulation import Simulation, load_graph
+
+
+VARIANTS = {
+    'default': {},
+    'optimized': {'optimized': True},
+    'congestion': {'congestion_interval': timedelta(minutes=5)}
+}
+
+
+def run_day(event_driven: bool, **kwargs) -> list[float]:
+    rng = np.random.default_rng(3)
+    simulation = Simulation(load_graph(MAP, rng), event_driven=event_driven, rng=rng, **kwargs)
+    return simulation.run(days=1)
+
+
+@pytest.mark.parametrize('variant', VARIANTS)
+def test_event_and_tick_modes_give_same_hourly_workloads(variant):
+    event_driven = run_day(True, **VARIANTS[variant])
+
+    assert len(event_driven) == 24
+    assert any(event_driven)
+    assert run_day(False, **VARIANTS[variant]) == event_driven
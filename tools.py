@@ -1,4 +1,6 @@
-from graph import Node, Edge
+import numpy as np
+
+from graph import EdgeStore
 
 
 A = -1.04772
@@ -8,6 +10,7 @@ D = -0.360749
 E = 1.01732
 
 HOUR = 3600
+MIN_BANDWIDTH_ROAD_FACTOR = 0.05
 
 
 def calc_bandwidth_road_factor(workload: float) -> float:
@@ -19,12 +22,15 @@ def calc_bandwidth_road_factor(workload: float) -> float:
     )
 
 
-def calc_avg_speed(edge: Edge) -> float:
-    a = 1 # calc_bandwidth_road_factor(edge.workload)
-    return a * edge.speed_limit
-
+def calc_roads_times(edges: EdgeStore, congestion: bool = False) -> np.ndarray:
+    """
+    Travel times in seconds of every road in the store at its average speed.
+    With congestion speeds are reduced by calc_bandwidth_road_factor of current workloads,
+    the factor is clamped, so roads are never faster than free flow and never stop completely.
+    """
+    avg_speed = edges.speed_limit[:len(edges)]
+    if congestion:
+        factors = np.clip(calc_bandwidth_road_factor(edges.workloads()), MIN_BANDWIDTH_ROAD_FACTOR, 1)
+        avg_speed = factors * avg_speed
 
-def calc_road_time(a: Node, b: Node) -> float:
-    edge = a.output_roads[b.idx]
-    avg_speed = calc_avg_speed(edge)
-    return HOUR * (edge.length / 1000) / avg_speed
+    return HOUR * (edges.length[:len(edges)] / 1000) / avg_speed
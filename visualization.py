@@ -1,76 +1,153 @@
 from datetime import timedelta
+from time import perf_counter
+import os
 
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from analysis import peak_hours_diff
 from meter import calculate_hourly_averages
 from graph import Graph
 
 HOUR = 3600
 MINUTE = 60
 
-node_positions = None
+# edges of bigger graphs are drawn without workload labels
+MAX_LABELED_EDGES = 200
+DEFAULT_FPS = 10.0
+FIGURE_SIZE = (20, 10)
+# networkx lays out bigger graphs with a slow sparse spring algorithm, minutes for thousands of nodes
+MAX_SPRING_NODES = 500
 
 
-def show(g: Graph, time: timedelta) -> None:
-    global node_positions
+def graph_geometry(g: Graph) -> tuple[np.ndarray, np.ndarray]:
+    """
+    road_geometry of the graph.
+    """
+    store = g.edge_store
+    return road_geometry(len(g.nodes), store.from_idx[:len(store)], store.to_idx[:len(store)])
+
 
+def road_geometry(nodes: int, from_idx: np.ndarray, to_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Positions of nodes and segments of roads, shifted to the right of their direction,
+    so both roads of a two-way street are seen.
+    Graphs up to MAX_SPRING_NODES get a spring layout, bigger ones a much cheaper spectral layout.
+    """
     G = nx.DiGraph()
+    G.add_nodes_from(range(nodes))
+    G.add_edges_from(zip(from_idx.tolist(), to_idx.tolist()))
+
+    if nodes > MAX_SPRING_NODES:
+        layout = nx.spectral_layout(G)
+    else:
+        layout = nx.spring_layout(G, k=1, iterations=50, seed=0)
+    positions = np.array([layout[idx] for idx in range(nodes)])
+
+    starts = positions[from_idx]
+    ends = positions[to_idx]
+    directions = ends - starts
+    lengths = np.maximum(np.hypot(directions[:, 0], directions[:, 1]), 1e-9)[:, None]
+    shift = np.column_stack([directions[:, 1], -directions[:, 0]]) / lengths * 0.015 * np.ptp(positions)
+
+    return positions, np.stack([starts + shift, ends + shift], axis=1)
+
+
+def format_clock(seconds: int) -> str:
+    hours = str(seconds // HOUR).rjust(2, '0')
+    minutes = str(seconds % HOUR // 60).rjust(2, '0')
+    seconds = str(seconds % HOUR % MINUTE).rjust(2, '0')
+    return f"{hours}:{minutes}:{seconds}"
+
+
+class NetworkArtists:
+    """
+    Nodes, one LineCollection of roads and their labels on a figure,
+    built once and updated with new workloads of roads.
+    """
+    def __init__(self, figure: Figure, positions: np.ndarray, segments: np.ndarray) -> None:
+        axes = figure.add_subplot()
+        axes.set_axis_off()
+
+        small = len(positions) <= 100
+        axes.scatter(positions[:, 0], positions[:, 1], s=500 if small else 10, c='lightblue', zorder=2)
+        if small:
+            for idx, position in enumerate(positions):
+                axes.annotate(str(idx), position, ha='center', va='center', zorder=3)
+
+        self._roads = LineCollection(segments, linewidths=1.5, zorder=1)
+        axes.add_collection(self._roads)
+        axes.autoscale_view()
+
+        self._labels = []
+        if len(segments) <= MAX_LABELED_EDGES:
+            self._labels = [
+                axes.text(x, y, '', ha='center', va='center')
+                for x, y in segments.mean(axis=1).tolist()
+            ]
 
-    for node in g.nodes:
-        G.add_node(node.idx)
+        self._title = axes.set_title('')
+        self._colors = np.zeros((len(segments), 4))
+        self._colors[:, 1] = 0.3
+        self._colors[:, 3] = 1.0
 
-    edge_labels = {}
-    edge_colors = {}
-    for node in g.nodes:
-        for to_node, edge in node:
-            G.add_edge(node.idx, to_node)
-            workload_percentage = round(edge.workload * 100, 1)
-            edge_labels[(node.idx, to_node)] = f"{workload_percentage}"
+    def update(self, workloads: np.ndarray, seconds: int) -> None:
+        self._colors[:, 0] = np.clip(workloads, 0, 1)
+        self._roads.set_color(self._colors)
 
-            edge_colors[(node.idx, to_node)] = workload_percentage / 100
+        for label, color, workload in zip(self._labels, self._colors.tolist(), workloads.tolist()):
+            label.set_text(f"{round(workload * 100, 1)}")
+            label.set_color(color)
 
-    if node_positions is None:
-        node_positions = nx.spring_layout(G, k=1, iterations=50)
+        self._title.set_text(format_clock(seconds))
 
-    plt.clf()
-    plt.figure(1, figsize=(20, 10))
 
-    nx.draw_networkx_nodes(G, node_positions, node_color='lightblue', node_size=500)
-    nx.draw_networkx_labels(G, node_positions)
+class Renderer:
+    """
+    Retained-mode drawing of the graph: the artists are built on the first frame,
+    later frames only recolor roads and rewrite labels.
+    Frames come at most max_fps times per second of wall-clock time, calls in between return at once,
+    and drawing never sleeps, so the simulation runs as fast as it can between frames.
+    """
+    max_fps: float
 
-    for edge in G.edges():
-        color = edge_colors[edge]
-        params = {
-            "edgelist": [edge],
-            "edge_color": (color, 0.3, 0),
-            "arrows": True
-        }
+    def __init__(self, max_fps: float = DEFAULT_FPS) -> None:
+        self.max_fps = max_fps
+        self._last_frame = None
+        self._figure = None
+        self._artists = None
 
-        if (edge[1], edge[0]) in G.edges():
-            params["connectionstyle"] = "arc3,rad=0.3"
+    def __call__(self, g: Graph, time: timedelta) -> None:
+        now = perf_counter()
+        if self._last_frame is not None and now - self._last_frame < 1 / self.max_fps:
+            return
+        self._last_frame = now
 
-        nx.draw_networkx_edges(G, node_positions, **params)
+        if self._figure is None or not plt.fignum_exists(self._figure.number):
+            self._figure = plt.figure(figsize=FIGURE_SIZE)
+            self._artists = NetworkArtists(self._figure, *graph_geometry(g))
 
-    for edge, label in edge_labels.items():
-        color = edge_colors[edge]
-        x1, y1 = node_positions[edge[0]]
-        x2, y2 = node_positions[edge[1]]
-        if (edge[1], edge[0]) in G.edges():
-            x = (x1 + x2) / 2 + (y2 - y1) / 4
-            y = (y1 + y2) / 2 - (x2 - x1) / 4
-        else:
-            x = (x1 + x2) / 2
-            y = (y1 + y2) / 2
-        plt.text(x, y, label, ha='center', va='center', color=(color, 0.3, 0))
+        self._artists.update(g.edge_store.workloads(), time.seconds)
 
-    hours = str(time.seconds // HOUR).rjust(2, '0')
-    minutes = str(time.seconds % HOUR // 60).rjust(2, '0')
-    seconds = str(time.seconds % HOUR % MINUTE).rjust(2, '0')
+        self._figure.canvas.draw_idle()
+        self._figure.canvas.flush_events()
 
-    plt.title(f"{hours}:{minutes}:{seconds}")
-    plt.axis('off')
-    plt.pause(0.01)
-    plt.show(block=False)
+
+_renderer = None
+
+
+def show(g: Graph, time: timedelta) -> None:
+    """
+    Draws the graph with a shared Renderer.
+    """
+    global _renderer
+
+    if _renderer is None:
+        _renderer = Renderer()
+
+    _renderer(g, time)
 
 
 def plot_hourly_data(data_sets: list[dict]) -> None:
@@ -135,29 +212,19 @@ def calc_diff_on_peak_hours(*args, filepaths: str) -> list[float]:
         if a > 23 or a < 0:
             raise ValueError("Arguments values must be between 0 and 23")
 
-    mins = [float("inf")] * 24
-    maxes = [-float("inf")] * 24
-
-    for filepath in filepaths:
-        averages = calculate_hourly_averages(filepath)
-        for idx in args:
-            mins[idx] = min(mins[idx], averages[idx])
-            maxes[idx] = max(maxes[idx], averages[idx])
-    
-    return [round((1 - mins[i] / maxes[i]) * 100, 1) for i in args] 
+    return peak_hours_diff(args, filepaths)
 
 
 if __name__ == "__main__":
-    print(calc_diff_on_peak_hours(
-        9, 18,
-        filepaths=[
-            'stat\hourly_factors_default.csv',
-            'stat\hourly_factors_optimized.csv']
-        )
-    )
+    filepaths = [
+        os.path.join('stat', 'hourly_factors_default.csv'),
+        os.path.join('stat', 'hourly_factors_optimized.csv')
+    ]
+
+    print(calc_diff_on_peak_hours(9, 18, filepaths=filepaths))
 
     analyze_and_plot(
-        filepaths=['stat\hourly_factors_default.csv', 'stat\hourly_factors_optimized.csv'],
+        filepaths=filepaths,
         labels=['Default', 'Optimized'],
         colors=['blue', 'orange']
     )